@@ -10,6 +10,7 @@ import copy
 import re
 import types
 import discourse_model
+import tracing
 
 def generator(num):
     'Provides unique, increasing integers.'
@@ -19,9 +20,20 @@ def generator(num):
 
 ACTION_ID = generator(1)
 
+# The core fields of every Action, kept in slots rather than in a dictionary.
+# Each kind of Action has slots for its own fields, too.
+ACTION_CORE = ['id', 'verb', 'agent', 'cause', 'salience', 'behave',
+               'configure', 'modify', 'sense', '_category', 'preconditions',
+               'start', 'final', 'failed', 'refusal', 'enlightened', 'force',
+               'template', 'direct', 'indirect']
+
 class Action(object):
     'Abstract base class for things done by an agent in the world.'
 
+    # Other attributes, such as those set by fictions, are in the Action's
+    # dictionary, which is only created when one is set.
+    __slots__ = ACTION_CORE + ['__dict__', '__weakref__']
+
     def __init__(self, verb, agent, category, **keywords):
         if self.__class__ == Action:
             raise StandardError('Attempt to instantiate abstract base ' +
@@ -44,6 +56,20 @@ class Action(object):
         self.refusal = None
         self.enlightened = []
 
+    def __getstate__(self):
+        'Return the core fields and other attributes, for copying and saving.'
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', []):
+                if not name[:2] == '__' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        for (name, value) in state.items():
+            setattr(self, name, value)
+
     def __str__(self):
         'Describes the action in a one-line string.'
         string = ':' + str(self.id) + ': '
@@ -115,8 +141,12 @@ class Action(object):
         'Make the world as if this action had never happened.'
         self.change(world, False)
 
+    @tracing.traced('Action.do')
     def do(self, world):
-        'Perform the action, updating the world.'
+        """Perform the action, updating the world.
+
+        Once done, the Action is not changed. The World and the Concepts of
+        all Actors aware of it share this one Action rather than copies."""
         to_be_done = []
         aware = set()
         self.start = world.ticks
@@ -150,8 +180,8 @@ class Action(object):
             if world.can_see(actor, self.agent):
                 aware.add(actor)
         for actor in aware:
-            world.concept[actor].act[self.id] = copy.deepcopy(self)
-        world.act[self.id] = self
+            world.concept[actor].add_action(self)
+        world.add_action(self)
         return to_be_done
 
     def moved_somewhere_different(self, actor):
@@ -205,13 +235,12 @@ class Action(object):
         # Finally, if there have been no other failures, continue
         # to test to see if the parent, with this new child,
         # is still allowed in the grandparent, and so on up the
-        # tree. This is done for now rather expensively. A copy
-        # of the world is made and, in it, the item is added as a
-        # child of the new parent. Then, the testing proceeds.
+        # tree. The test uses a view of the world in which only
+        # the new parent is copied, with the item added as its
+        # child. Then, the testing proceeds up the ancestors.
         elif reason is None and not world.item[parent].parent == '@cosmos':
             met = True
-            test = copy.deepcopy(world)
-            test.item[parent].add_child(link, tag)
+            test = world.with_child(parent, link, tag)
             met &= test.item[parent].allowed(tag, link, test)
             while met and not parent == '@cosmos':
                 tag = parent
@@ -297,6 +326,8 @@ class Action(object):
 class Behave(Action):
     'An action that itself changes nothing, e.g., jumping up and down.'
 
+    __slots__ = ['target', 'direction', 'utterance']
+
     def __init__(self, verb, agent, **keywords):
         # Behave actions may have 'direct' 'indirect' 'direction' and/or 'utterance'
         for i in ['direct', 'indirect', 'target', 'direction', 'utterance']:
@@ -366,6 +397,8 @@ class Behave(Action):
 class Configure(Action):
     'An action that repositions an item in the item tree.'
 
+    __slots__ = ['new_link', 'new_parent', 'old_link', 'old_parent']
+
     def __init__(self, verb, agent, **keywords):
         # Configure Actions must have 'direct' and 'new'.
         self.direct = keywords['direct']
@@ -405,6 +438,7 @@ class Configure(Action):
                     # Before the Action, the Actor can see the Item.
                     # Update the Item's departure from the "from" Item.
                     new_from = copy.deepcopy(world.item[self.old_parent])
+                    tracing.count('deepcopy')
                     new_from.remove_child(self.old_link, self.direct,
                                           making_change)
                     if not world.can_see(actor, self.old_parent):
@@ -419,6 +453,7 @@ class Configure(Action):
         if making_change:
             item.parent = self.new_parent
             item.link = self.new_link
+            world.items_changed()
             for actor in world.concept:
                 room_tag = str(world.room_of(actor))
                 # If the item disappeared from sight, transfer it out...
@@ -429,10 +464,11 @@ class Configure(Action):
                     # After the Action, the Actor can see the Item.
                     # Update the Item itself ...
                     world.transfer(item, actor, self.end)
-                new_to = copy.deepcopy(world.item[self.new_parent])
+                new_to = world.item[self.new_parent]
                 if (actor == self.new_parent or
                     world.can_see(actor, self.new_parent)):
-                    # If the "to" Item is visible, update it fully.
+                    # If the "to" Item is visible, update it fully. It is
+                    # only copied if the Actor's version of it is different.
                     world.transfer(new_to, actor, self.end)
                     # If the "to" Item is a Room, update other visible Rooms.
                     if new_to.room:
@@ -444,6 +480,8 @@ class Configure(Action):
                     if (actor == self.direct and
                         not world.can_see(actor, room_tag)):
                     # Moved into a dark room; blank out the "to" item.
+                        new_to = copy.deepcopy(new_to)
+                        tracing.count('deepcopy')
                         new_to.blank()
                         new_to.add_child(self.new_link, self.direct,
                                          making_change)
@@ -459,6 +497,7 @@ class Configure(Action):
         else:
             item.parent = self.old_parent
             item.link = self.old_link
+            world.items_changed()
 
     def pre(self, world):
         """Preconditions for Configure:
@@ -557,6 +596,8 @@ class Configure(Action):
 class Modify(Action):
     "An action that changes some Item's state, the value of a feature."
 
+    __slots__ = ['feature', 'new_value', 'old_value']
+
     def __init__(self, verb, agent, **keywords):
         # Modify actions must have 'direct', 'feature', and 'new'
         self.direct = keywords['direct']
@@ -593,6 +634,7 @@ class Modify(Action):
         # Make the change.
         value = (self.old_value, self.new_value)[making_change]
         setattr(item, self.feature, value)
+        world.items_changed(self.feature)
         # Update the item in actors who can perceive this event. Also, check
         # to see if the actor's room became visible and needs an update.
         if making_change:
@@ -654,6 +696,8 @@ class Modify(Action):
 class Sense(Action):
     'A perception that can update a concept.'
 
+    __slots__ = ['modality']
+
     def __init__(self, verb, agent, **keywords):
         # Sense Actions must have 'direct' and 'modality'.
         for i in ['direct', 'modality']:
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+'Time each stage of Curveship as fictions are played through their inputs.'
+
+__author__ = 'Nick Montfort'
+__copyright__ = 'Copyright 2011 Nick Montfort'
+__license__ = 'ISC'
+__version__ = '0.5.0.0'
+__status__ = 'Development'
+
+import glob
+import json
+import optparse
+import os
+import platform
+import sys
+import time
+
+import clarifier
+import curveship
+import microplanner
+import preparer
+import presenter
+import realizer
+import recognizer
+import reply_planner
+
+STAGES = ['preparer', 'recognizer', 'clarifier', 'simulator', 'reply_planner',
+          'microplanner', 'realizer', 'presenter']
+
+# The functions (and one method) that make up each stage of the pipeline.
+STAGE_FUNCTIONS = [('preparer', preparer, 'prepare'),
+                   ('preparer', preparer, 'tokenize'),
+                   ('recognizer', recognizer, 'recognize'),
+                   ('clarifier', clarifier, 'clarify'),
+                   ('simulator', curveship, 'simulator'),
+                   ('reply_planner', reply_planner, 'plan'),
+                   ('microplanner', microplanner, 'specify'),
+                   ('realizer', realizer.Section, 'realize'),
+                   ('presenter', presenter, 'present'),
+                   ('presenter', presenter, 'center')]
+
+class StageTimer(object):
+    """Accumulates the time spent in each stage during each turn.
+
+    Time spent in a stage that is called from within another (for instance,
+    the presenter showing the clarifier's question) counts only toward the
+    inner stage."""
+
+    def __init__(self):
+        self.startup = self.new_turn(None)
+        self.current = self.startup
+        self.turns = []
+        self.nested = []
+        self.originals = []
+
+    def new_turn(self, input_string):
+        'Returns a record of a turn with no time spent in any stage yet.'
+        turn = {'input': input_string, 'total': 0.0}
+        for stage in STAGES:
+            turn[stage] = 0.0
+        return turn
+
+    def timed(self, stage, function):
+        'Returns the function, changed to add the time it takes to a stage.'
+        def timed_function(*args, **keywords):
+            start = time.time()
+            self.nested.append(0.0)
+            try:
+                return function(*args, **keywords)
+            finally:
+                elapsed = time.time() - start
+                self.current[stage] += elapsed - self.nested.pop()
+                if len(self.nested) > 0:
+                    self.nested[-1] += elapsed
+        return timed_function
+
+    def timed_turn(self, each_turn):
+        'Returns each_turn, changed to start a new record for every turn.'
+        def timed_each_turn(world, discourse, *args, **keywords):
+            input_string = None
+            if (discourse.spin['commanded'] is not None and
+                len(discourse.initial_inputs) > 0):
+                input_string = discourse.initial_inputs[0].strip()
+            self.current = self.new_turn(input_string)
+            self.turns.append(self.current)
+            start = time.time()
+            result = each_turn(world, discourse, *args, **keywords)
+            self.current['total'] = time.time() - start
+            return result
+        return timed_each_turn
+
+    def install(self):
+        'Replace the stage functions with timed ones.'
+        for (stage, owner, name) in STAGE_FUNCTIONS:
+            function = owner.__dict__[name]
+            self.originals.append((owner, name, function))
+            setattr(owner, name, self.timed(stage, function))
+        self.originals.append((curveship, 'each_turn', curveship.each_turn))
+        curveship.each_turn = self.timed_turn(curveship.each_turn)
+
+    def remove(self):
+        'Put back the original stage functions.'
+        while len(self.originals) > 0:
+            (owner, name, function) = self.originals.pop()
+            setattr(owner, name, function)
+
+
+def time_session(if_file, spin_files, input_file, width=80, seed=None):
+    'Play one session with timed stages and return a record of it.'
+    timer = StageTimer()
+    inputs = []
+    if input_file is not None:
+        inputs = curveship.read_inputs(input_file)
+    null_stream = open(os.devnull, 'w')
+    timer.install()
+    try:
+        start = time.time()
+        curveship.replay(if_file, spin_files, inputs, null_stream, width,
+                         seed=seed)
+        total = time.time() - start
+    finally:
+        timer.remove()
+        null_stream.close()
+    timer.startup['total'] = total - sum([t['total'] for t in timer.turns])
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = (timer.startup[stage] +
+                         sum([turn[stage] for turn in timer.turns]))
+    return {'fiction': if_file, 'spins': spin_files, 'inputs': input_file,
+            'total': total, 'stages': stages, 'startup': timer.startup,
+            'turns': timer.turns, 'error': None}
+
+
+def sessions(fiction_files, spin_files):
+    'List the (fiction, spins, inputs) to time: each input file and spin.'
+    combinations = []
+    for if_file in fiction_files:
+        name = os.path.splitext(os.path.basename(if_file))[0]
+        input_files = sorted(glob.glob(os.path.join('walk', name + '_*.txt')))
+        if len(input_files) == 0:
+            input_files = [None]
+        for input_file in input_files:
+            for spin_file in [None] + spin_files:
+                spins = []
+                if spin_file is not None:
+                    spins = [spin_file]
+                combinations.append((if_file, spins, input_file))
+    return combinations
+
+
+def run_session(if_file, spin_files, input_file, seed):
+    """Time one session and return the record, noting any error instead.
+
+    Each session loads its fiction and spin files anew, so sessions are
+    all timed in this process."""
+    try:
+        return time_session(if_file, spin_files, input_file, seed=seed)
+    except Exception, err:
+        return {'fiction': if_file, 'spins': spin_files, 'inputs': input_file,
+                'error': err.__class__.__name__ + ': ' + str(err)}
+
+
+def parse_command_line(argv):
+    'Returns the options and the fiction files to time, if any were given.'
+    parser = optparse.OptionParser(usage='[options] [ fiction.py ... ]')
+    parser.add_option('--nospin', action='store_true', dest='nospin',
+                      help='time the fictions without any spin files',
+                      default=False)
+    parser.add_option('--output', dest='output', metavar='FILE',
+                      help='write the results to FILE rather than stdout')
+    parser.add_option('--seed', dest='seed', type='int', default=0,
+                      help='seed the random number generator with N',
+                      metavar='N')
+    return parser.parse_args(argv[1:])
+
+
+def main(argv):
+    """Time sessions and write the results as JSON.
+
+    By default, every fiction is timed with each of its input files, first
+    without a spin and then with each spin file."""
+    opts, args = parse_command_line(argv)
+    fiction_files = args
+    if len(fiction_files) == 0:
+        fiction_files = sorted([f for f in glob.glob('fiction/*.py') if
+                                not os.path.basename(f) == '__init__.py'])
+    spin_files = []
+    if not opts.nospin:
+        spin_files = sorted([f for f in glob.glob('spin/*.py') if
+                             not os.path.basename(f) == '__init__.py'])
+    results = {'curveship': curveship.__version__,
+               'python': platform.python_version(),
+               'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'seed': opts.seed, 'stages': STAGES, 'runs': []}
+    for (if_file, spins, input_file) in sessions(fiction_files, spin_files):
+        run = run_session(if_file, spins, input_file, opts.seed)
+        results['runs'].append(run)
+        if run['error'] is None:
+            outcome = '%.3fs, %d turns' % (run['total'], len(run['turns']))
+        else:
+            outcome = 'error: ' + run['error']
+        sys.stderr.write(' '.join([if_file] + spins) + ': ' + outcome + '\n')
+    if opts.output is None:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        output = open(opts.output, 'w')
+        json.dump(results, output, indent=1, sort_keys=True)
+        output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -34,43 +34,68 @@ def english_command(tokens, concept, discourse):
     return line[:-1]
 
 
+def is_ambiguous(user_input):
+    'Does clarifying this input mean asking which command was meant?'
+    return not (len(user_input.normal) == 0 and len(user_input.possible) == 0)
+
+
+def question(user_input, concept, discourse):
+    'Returns a question asking which of the possible commands was meant.'
+    text = '(Is this a command to '
+    options = []
+    for possibility in user_input.possible:
+        options.append('(' + str(len(options) + 1) + ') "' +
+                       english_command(possibility, concept, discourse) + '"')
+    options.append('(' + str(len(options) + 1) + ') none of these')
+    text += discourse.list_phrases(options, conjunction='or') + '?)'
+    return re.sub('",', ',"', text)
+
+
+def prompt(user_input):
+    'Returns the prompt for the number of the command that was meant.'
+    return '(1-' + str(len(user_input.possible) + 1) + ')? '
+
+
+def choose(user_input, choose_a_number, discourse):
+    """Returns a reply to the answer given to the question.
+
+    If one of the possible commands was selected, the input becomes that
+    command."""
+    selected = None
+    if len(choose_a_number.tokens) == 1:
+        try:
+            selected = int(choose_a_number.tokens[0])
+        except ValueError:
+            pass
+    possible = len(user_input.possible)
+    if selected is None or selected < 1 or selected > possible:
+        clarification = ('\n(Since you did not select '+
+                         discourse.list_phrases(range(1, possible + 1),
+                         conjunction='or') + ', the command "' + 
+                         str(user_input) +
+                         '" cannot be understood. Try something else.)')
+    else:
+        clarification = '\n(Very well ...)'
+        user_input.category = 'command'
+        user_input.normal = user_input.possible[selected-1]
+    return clarification
+
+
 def clarify(user_input, concept, discourse, in_stream, out_streams):
     'States that input was not understood or attempts to disambiguate input.'
 
-    if len(user_input.normal) == 0 and len(user_input.possible) == 0:
+    if not is_ambiguous(user_input):
         clarification = ('(It\'s not clear what "' + str(user_input) +
         '" means. Try typing some other command to ' +
         concept.item[discourse.spin['commanded']].noun_phrase(discourse) + '.)')
     else:
-        question = '(Is this a command to '
-        commands = []
-        options = []
-        for possibility in user_input.possible:
-            commands.append(english_command(possibility, concept, discourse))
-            options.append('(' + str(len(commands)) + ') "' +
-                           commands[-1] + '"')
-        options.append('(' + str(len(commands) + 1) + ') none of these')
-        question += discourse.list_phrases(options, conjunction='or') + '?)'
-        question = re.sub('",', ',"', question)
-        presenter.present(question, out_streams)
+        presenter.present(question(user_input, concept, discourse),
+                          out_streams)
         choose_a_number = preparer.prepare(discourse.separator,
-                          '(1-' + str(len(commands) + 1) + ')? ', in_stream)
-        selected = None
-        if len(choose_a_number.tokens) == 1:
-            try:
-                selected = int(choose_a_number.tokens[0])
-            except ValueError:
-                pass
-        if selected is None or selected < 1 or selected > len(commands):
-            clarification = ('\n(Since you did not select '+
-                             discourse.list_phrases(range(1, len(commands) + 1),
-                             conjunction='or') + ', the command "' + 
-                             str(user_input) +
-                             '" cannot be understood. Try something else.)')
-        else:
-            clarification = '\n(Very well ...)'
-            user_input.category = 'command'
-            user_input.normal = user_input.possible[selected-1]
+                                           prompt(user_input), in_stream,
+                                           out_streams)
+        discourse.input_list.add_line(choose_a_number.string)
+        clarification = choose(user_input, choose_a_number, discourse)
 
     presenter.present(clarification, out_streams)
     return user_input
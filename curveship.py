@@ -11,24 +11,44 @@ import sys
 import os
 import time
 import optparse
+import StringIO
 
 import clarifier
 import command_map
 import discourse_model
 import joker
+import journal
 import microplanner
 import preparer
 import presenter
 import recognizer
 import reply_planner
+import session_log
+import tracing
 import world_model
 
+class Commands(object):
+    """The command mappings of one session.
+
+    Mappings added by the session's fiction are kept here, so that they are
+    not seen by other sessions. All others are those in command_map."""
+
+    def __getattr__(self, name):
+        return getattr(command_map, name)
+
+
 class Multistream(object):
-    'Encapsultes multiple output streams.'
+    """Encapsultes multiple output streams.
 
-    def __init__(self, streams, log=None):
+    If a width is given, output is lineated to it rather than to the width
+    of the terminal. Records of each turn are written to "records," if it is
+    set, and closed with the streams."""
+
+    def __init__(self, streams, log=None, width=None):
         self.streams = streams
         self.log = log
+        self.width = width
+        self.records = None
 
     def close(self):
         """Close each of the streams.
@@ -40,6 +60,8 @@ class Multistream(object):
             status = stream.close()
             if status is not None:
                 overall_status = max(overall_status, status)
+        if self.records is not None:
+            self.records.close()
         return overall_status
 
     def write(self, string):
@@ -48,17 +70,44 @@ class Multistream(object):
             stream.write(string)
 
 
+class InputList(object):
+    """An input stream that reads from a list of input strings.
+
+    The list is not copied, so inputs taken from it by other means are not
+    read again. When the list is empty, the stream is at its end."""
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+
+    def close(self):
+        'Nothing needs to be closed.'
+        pass
+
+    def isatty(self):
+        'This is never a terminal.'
+        return False
+
+    def readline(self):
+        'Remove and return the next input, or "" if there are none left.'
+        if len(self.inputs) == 0:
+            return ''
+        return self.inputs.pop(0)
+
+
 def start_log(out_streams):
-    'Open a log file named with the next available integer.'
-    log_files = [os.path.splitext(l)[0] for l in os.listdir('logs/') if
-                 os.path.splitext(l)[1] == '.log']
-    if len(log_files) == 0:
-        latest = 0
-    else:
-        latest = max([int(log_file) for log_file in log_files])
-    log_file = 'logs/' + str(latest + 1) + '.log'
+    """Open a log file named with the next available integer.
+
+    Beside it, a file with the same number and the extension ".jsonl" gets
+    a record of each turn."""
+    try:
+        log_file = session_log.new_log_name('logs/')
+    except (IOError, OSError), err:
+        raise joker.StartupError('Unable to number a new log file in ' +
+                                 '"logs/" due to this error: ' + str(err))
     try:
-        log = file(log_file, 'w')
+        log = session_log.LogFile(log_file)
+        out_streams.records = session_log.LogFile(os.path.splitext(log_file)[0]
+                                                  + '.jsonl')
     except IOError, err:
         msg = ('Unable to open log file "' + log_file + '" for ' +
                'writing due to this error: ' + str(err))
@@ -72,30 +121,43 @@ def start_log(out_streams):
     return out_streams
 
 
-def initialize(if_file, spin_files, out_streams):
-    'Load all files and present the header and prologue.'
+def initialize(if_file, spin_files, out_streams, commands=command_map,
+               modules=None, seed=None):
+    """Load all files and present the header and prologue.
+
+    The fiction's own command mappings are added to commands. If a dictionary
+    of modules is given, the fiction and spin files are loaded anew rather
+    than reused, and their modules are kept in it. The session's random
+    number generator, which the World, Concepts, and Discourse share, is
+    seeded with the seed given or, if there is none, a new one."""
+    if seed is None:
+        seed = int(os.urandom(4).encode('hex'), 16)
     for startup_string in joker.session_startup(__version__):
         presenter.center(startup_string, out_streams)
     fiction = joker.load_fiction(if_file, ['discourse', 'items'],
-                                 discourse_model.FICTION_DEFAULTS)
+                                 discourse_model.FICTION_DEFAULTS, modules)
     presenter.center('fiction: ' + if_file, out_streams)
+    files = (if_file, list(spin_files))
     world = world_model.World(fiction)
     world.set_concepts(fiction.concepts)
     for i in dir(fiction):
         if i[:8] == 'COMMAND_':            
-            setattr(command_map, i.partition('_')[2], getattr(fiction, i))
+            setattr(commands, i.partition('_')[2], getattr(fiction, i))
             delattr(fiction, i)
     for (key, value) in discourse_model.SPIN_DEFAULTS.items():
         if key not in fiction.discourse['spin']:
             fiction.discourse['spin'][key] = value
     while len(spin_files) > 0:
         next_file = spin_files.pop(0)
-        new_spin = joker.load_spin(fiction.discourse['spin'], next_file)
+        new_spin = joker.load_spin(fiction.discourse['spin'], next_file,
+                                   modules)
         fiction.discourse['spin'].update(new_spin)
         presenter.center('spin: ' + next_file, out_streams)
     presenter.present('\n', out_streams)
     presenter.present('', out_streams)
-    discourse = discourse_model.Discourse(fiction.discourse)
+    discourse = discourse_model.Discourse(fiction.discourse, seed)
+    world.set_random(discourse.random)
+    (discourse.fiction_file, discourse.spin_files) = files
     reply = joker.show_frontmatter(discourse)
     if 'prologue' in discourse.metadata:
         reply += '\n\n' + joker.show_prologue(discourse.metadata)
@@ -103,7 +165,8 @@ def initialize(if_file, spin_files, out_streams):
     return (world, discourse)
 
 
-def handle_input(user_input, world, discourse, in_stream, out_streams):
+def handle_input(user_input, world, discourse, in_stream, out_streams,
+                 commands=command_map, modules=None):
     """Deal with input obtained, sending it to the appropriate module.
 
     The commanded character's concept is used when trying to recognize
@@ -113,9 +176,20 @@ def handle_input(user_input, world, discourse, in_stream, out_streams):
     if user_input.unrecognized:
         user_input = clarifier.clarify(user_input, c_concept, discourse,
                                        in_stream, out_streams)
+    return respond(user_input, world, discourse, out_streams, commands,
+                   modules)
+
+
+def respond(user_input, world, discourse, out_streams, commands=command_map,
+            modules=None):
+    """Simulate and narrate a recognized command, or carry out a directive.
+
+    The session's command mappings and, if it keeps them, its modules are
+    used by directives, such as restore, that replace the session."""
     if user_input.command:
         user_input, id_list, world = simulator(user_input, world,
-                                                  discourse.spin['commanded'])
+                                               discourse.spin['commanded'],
+                                               commands=commands)
         if hasattr(world.item['@cosmos'], 'update_spin'):
             discourse.spin = world.item['@cosmos'].update_spin(world, 
                                                                discourse)
@@ -126,8 +200,13 @@ def handle_input(user_input, world, discourse, in_stream, out_streams):
         tale, discourse = teller(id_list, f_concept, discourse)
         presenter.present(tale, out_streams)
     elif user_input.directive:
+        previous = discourse
         texts, world, discourse = joker.joke(user_input.normal, world,
-                                             discourse)
+                                             discourse, commands, modules)
+        if discourse is not previous and hasattr(previous, 'initial_inputs'):
+            # A restored session goes on with the inputs still to be played
+            # in this one, not with those it had when it was saved.
+            discourse.initial_inputs = previous.initial_inputs
         for text in texts:
             if text is not None:
                 presenter.present(text, out_streams)
@@ -135,13 +214,19 @@ def handle_input(user_input, world, discourse, in_stream, out_streams):
     return (user_input, world, discourse)
 
 
-def each_turn(world, discourse, in_stream, out_streams):
-    'Obtain and processes input, if the session is interactive.'
+def each_turn(world, discourse, in_stream, out_streams, pause=True,
+              commands=command_map, modules=None):
+    """Obtain and processes input, if the session is interactive.
+
+    If pause is False, there is no interval between non-interactive turns,
+    even if the fiction would have one."""
+    presenter.forget_terminal_size()
     if discourse.spin['commanded'] is None:
-        if hasattr(world.item['@cosmos'], 'interval'):
+        if pause and hasattr(world.item['@cosmos'], 'interval'):
             world.item['@cosmos'].interval()
         _, id_list, world = simulator(None, world,
-                                         discourse.spin['commanded'])
+                                      discourse.spin['commanded'],
+                                      commands=commands)
         focal_concept = world.concept[discourse.spin['focalizer']]
         reply_text, discourse = teller(id_list, focal_concept, discourse)
         presenter.present(reply_text, out_streams)
@@ -155,18 +240,149 @@ def each_turn(world, discourse, in_stream, out_streams):
             user_input = preparer.prepare(discourse.separator, 
                                           discourse.typo.prompt, in_stream, 
                                           out_streams)
+        discourse.input_list.add_line(user_input.string)
         # After each input, present a newline all by itself.
         presenter.present('\n', out_streams, '', '')
         while len(user_input.tokens) > 0 and world.running:
             (user_input, world, discourse) = handle_input(user_input, world,
                                               discourse, in_stream,
-                                              out_streams)
-            presenter.present(discourse.input_list.show(1),
-                              out_streams.log)
+                                              out_streams, commands, modules)
+            if out_streams.log is not None:
+                presenter.present(discourse.input_list.show(1),
+                                  out_streams.log)
+    return (world, discourse)
+
+
+def run_initial_actions(world, discourse, out_streams, commands=command_map):
+    "Simulate and narrate the fiction's initial actions, if there are any."
+    if len(world.act) > 0:
+        _, id_list, world = simulator(None, world,
+                                      discourse.spin['commanded'],
+                                      world.act.values(), commands)
+        focal_concept = world.concept[discourse.spin['focalizer']]
+        reply_text, discourse = teller(id_list, focal_concept, discourse)
+        presenter.present(reply_text, out_streams)
+    return (world, discourse)
+
+
+def play_lines(world, discourse, lines, commands=command_map):
+    """Play lines that were typed earlier, presenting nothing.
+
+    Saving and restoring are not done again."""
+    null_stream = open(os.devnull, 'w')
+    out_streams = Multistream([null_stream], width=80)
+    discourse.initial_inputs = [line.encode('utf-8') + '\n' for line in lines]
+    in_stream = InputList(discourse.initial_inputs)
+    discourse.rebuilding = True
+    try:
+        while world.running and len(discourse.initial_inputs) > 0:
+            world, discourse = each_turn(world, discourse, in_stream,
+                                         out_streams, False, commands)
+    except EOFError:
+        # The lines ended while the fiction was asking a question.
+        pass
+    finally:
+        del discourse.rebuilding
+        null_stream.close()
     return (world, discourse)
 
 
-def simulator(user_input, world, commanded, actions_to_do=None):
+def rebuild(record, commands=command_map, modules=None):
+    """Play a session again from a record of it; return the world and discourse.
+
+    The record gives the "fiction" and "spins" files the session started
+    with, whether "debug" directives were enabled, and the "lines" that were
+    typed, including answers to questions. The fiction and spin files are
+    loaded anew, since the session being replaced has changed the Items of
+    the ones already loaded. Their modules are kept in the dictionary given
+    or, if there is none, only in sys.modules."""
+    if modules is None:
+        modules = {}
+    null_stream = open(os.devnull, 'w')
+    out_streams = Multistream([null_stream], width=80)
+    try:
+        world, discourse = initialize(str(record['fiction']),
+                                      [str(s) for s in record['spins']],
+                                      out_streams, commands, modules,
+                                      record.get('seed'))
+        discourse.debug = record['debug']
+        world, discourse = run_initial_actions(world, discourse, out_streams,
+                                               commands)
+    finally:
+        null_stream.close()
+    return play_lines(world, discourse, record['lines'], commands)
+
+
+def recover(file_name, commands=command_map, modules=None):
+    """Return the world and discourse of a session recovered from its journal.
+
+    If there is a snapshot that the journal goes on from, the session is
+    restored from it and only the later lines are played. Otherwise, the
+    whole session is played again."""
+    record = journal.read_journal(file_name)
+    snapshot = journal.snapshot_name(file_name)
+    if os.path.exists(snapshot):
+        world, discourse = joker.read_session(snapshot, commands, modules)
+        done = discourse.input_list.lines
+        if record['lines'][:len(done)] == done:
+            return play_lines(world, discourse, record['lines'][len(done):],
+                              commands)
+    return rebuild(record, commands, modules)
+
+
+def read_inputs(file_name):
+    'Return the inputs, one per line, in a file such as a walkthrough.'
+    auto = open(file_name, 'r')
+    inputs = auto.readlines()
+    auto.close()
+    return inputs
+
+
+def replay(if_file, spin_files, inputs, out_stream=None, width=80,
+           debug=True, seed=None):
+    """Run a session on a list of inputs with no log, terminal, or prompt.
+
+    The transcript is written to the output stream, if one is given, and is
+    otherwise returned as a string. Output is lineated to the width given.
+    If the fiction asks which command was meant, the answer is the next
+    input. The session ends when the world stops running or, if it is
+    interactive, when the inputs run out. The fiction and spin files are
+    loaded anew, and the fiction's command mappings are kept apart, so that
+    sessions can be replayed one after another in the same process."""
+    if out_stream is None:
+        transcript = StringIO.StringIO()
+    else:
+        transcript = out_stream
+    out_streams = Multistream([transcript], width=width)
+    commands = Commands()
+    modules = {}
+    world, discourse = initialize(if_file, list(spin_files), out_streams,
+                                  commands, modules, seed)
+    discourse.debug = debug
+    discourse.initial_inputs = []
+    for input_string in inputs:
+        if not input_string[-1:] == '\n':
+            input_string += '\n'
+        discourse.initial_inputs.append(input_string)
+    in_stream = InputList(discourse.initial_inputs)
+    world, discourse = run_initial_actions(world, discourse, out_streams,
+                                           commands)
+    try:
+        while world.running and (discourse.spin['commanded'] is None or
+                                 len(discourse.initial_inputs) > 0):
+            world, discourse = each_turn(world, discourse, in_stream,
+                                         out_streams, False, commands,
+                                         modules)
+    except EOFError:
+        # The inputs ran out while the fiction was asking a question.
+        pass
+    if out_stream is None:
+        return transcript.getvalue()
+
+
+@tracing.traced('curveship.simulator')
+def simulator(user_input, world, commanded, actions_to_do=None,
+              commands=command_map):
     'Simulate the IF world using the Action from user input.'
     if actions_to_do is None:
         actions_to_do = []
@@ -177,11 +393,11 @@ def simulator(user_input, world, commanded, actions_to_do=None):
             world.item[tag].alive):
             # The commanded character does not act automatically. That is,
             # his, her, or its "act" method is not called.
-            new_actions = world.item[tag].act(command_map, world.concept[tag])
+            new_actions = world.item[tag].act(commands, world.concept[tag])
             actions_to_do.extend(new_actions)
     if commanded is not None and user_input is not None:
         commanded = world.item[commanded]
-        c_action = commanded.do_command(user_input.normal, command_map, world)
+        c_action = commanded.do_command(user_input.normal, commands, world)
         if c_action is not None:
             c_action.cause = '"' + ' '.join(user_input.normal) + '"'
             actions_to_do.append(c_action)
@@ -217,6 +433,19 @@ def parse_command_line(argv):
     parser.add_option('--nodebug', action='store_false', dest='debug',
                       help='disable debugging directives',
                       default=True)
+    parser.add_option('--journal', dest='journal', metavar='FILE',
+                      help='journal the session in FILE, or recover the ' +
+                      'session journaled there if it is not over')
+    parser.add_option('--headless', action='store_true', dest='headless',
+                      help='replay the --auto inputs with no log or ' +
+                      'terminal, then stop', default=False)
+    parser.add_option('--seed', dest='seed', type='int',
+                      help='seed the random number generator with N, so ' +
+                      'that the session can be played the same way again',
+                      metavar='N')
+    parser.add_option('--width', dest='width', type='int', default=80,
+                      help='lineate --headless output, or output that is ' +
+                      'not to a terminal, to N columns', metavar='N')
     opts, args = parser.parse_args(argv[1:])
     if not args:
         parser.print_usage()
@@ -224,34 +453,73 @@ def parse_command_line(argv):
                'needed; any other file names are processed in order ' +
                'as spin files.')
         raise joker.StartupError(msg)
+    if opts.headless and opts.autofile is None:
+        parser.print_usage()
+        raise joker.StartupError('The --headless option replays the ' +
+                                 'inputs from a file given with --auto.')
     return opts, args
 
 
 def main(argv, in_stream=sys.stdin, out_stream=sys.stdout):
     "Set up a session and run Curveship's main loop."
     return_code = 0
+    session_journal = None
+    # The session's own fiction and spin modules, replaced if it is restored.
+    modules = {}
     try:
         out_streams = Multistream([out_stream])
         opts, args = parse_command_line(argv)
+        if opts.headless:
+            replay(args[0], args[1:], read_inputs(opts.autofile),
+                   out_stream, opts.width, opts.debug, opts.seed)
+            return return_code
+        if out_stream.isatty():
+            presenter.watch_terminal_size()
+        else:
+            out_streams.width = opts.width
         out_streams = start_log(out_streams)
-        world, discourse = initialize(args[0], args[1:], out_streams)
-        discourse.debug = opts.debug
+        if (opts.journal is not None and os.path.exists(opts.journal) and
+            journal.read_journal(opts.journal) is not None):
+            world, discourse = recover(opts.journal, modules=modules)
+            session_journal = journal.Journal(opts.journal,
+                                              journal.SNAPSHOT_EVERY)
+            session_journal.continue_from(discourse)
+            presenter.present(joker.report('recovered', opts.journal),
+                              out_streams)
+        else:
+            world, discourse = initialize(args[0], args[1:], out_streams,
+                                          modules=modules, seed=opts.seed)
+            discourse.debug = opts.debug
+            if opts.journal is not None:
+                session_journal = journal.Journal(opts.journal,
+                                                  journal.SNAPSHOT_EVERY)
+            world, discourse = run_initial_actions(world, discourse,
+                                                   out_streams)
         if opts.autofile is not None:
-            auto = open(opts.autofile, 'r+')
-            discourse.initial_inputs = auto.readlines()
-            auto.close()
-        if len(world.act) > 0:
-            _, id_list, world = simulator(None, world,
-                                          discourse.spin['commanded'],
-                                          world.act.values())
-            focal_concept = world.concept[discourse.spin['focalizer']]
-            reply_text, discourse = teller(id_list, focal_concept, discourse)
-            presenter.present(reply_text, out_streams)
+            discourse.initial_inputs = read_inputs(opts.autofile)
+        turn = 0
         while world.running:
             previous_time = time.time()
+            # What is added to these in the turn goes into its record, even
+            # if the turn replaces the World and Discourse with restored ones.
+            (input_list, done) = (discourse.input_list, world.done)
+            (inputs, lines, actions) = (input_list.total()[0],
+                                        len(input_list.lines), len(done))
             world, discourse = each_turn(world, discourse, in_stream,
-                                         out_streams)
-            out_streams.log.write('#' + str(time.time() - previous_time))
+                                         out_streams, modules=modules)
+            if session_journal is not None:
+                session_journal.update(world, discourse)
+            seconds = time.time() - previous_time
+            out_streams.log.write('#' + str(seconds))
+            turn += 1
+            out_streams.records.write_record(session_log.turn_record(turn,
+                input_list.lines[lines:], input_list.since(inputs),
+                [action.id for action in done[actions:]], seconds))
+            out_streams.log.flush()
+            out_streams.records.flush()
+        if session_journal is not None:
+            session_journal.end()
+            session_journal = None
     except joker.StartupError, err:
         presenter.present(err.msg, Multistream([sys.stderr]))
         return_code = 2
@@ -262,6 +530,8 @@ def main(argv, in_stream=sys.stdin, out_stream=sys.stdout):
         presenter.present('\n', out_streams)
         return_code = 2
     finally:
+        if session_journal is not None:
+            session_journal.close()
         in_stream.close()
         out_streams.close()
     return return_code
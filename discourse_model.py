@@ -7,7 +7,10 @@ __version__ = '0.5.0.0'
 __status__ = 'Development'
 
 import math
+import random
 import re
+import sre_constants
+import sre_parse
 import types
 
 import input_model
@@ -82,6 +85,124 @@ def splitoff(string):
             return [string]
 
 
+def expand_expression(parsed, limit=500):
+    """Return every string a parsed regular expression can match.
+
+    Only alternation, optional parts, and literal characters are expanded,
+    which covers the verb parts of the command grammar. None is returned if
+    the expression uses anything else or can match more than limit strings."""
+    strings = ['']
+    for (opcode, argument) in parsed:
+        if opcode == sre_constants.LITERAL:
+            options = [chr(argument)]
+        elif opcode == sre_constants.SUBPATTERN:
+            options = expand_expression(argument[-1], limit)
+        elif opcode == sre_constants.BRANCH:
+            options = []
+            for branch in argument[1]:
+                more = expand_expression(branch, limit)
+                if more is None:
+                    return None
+                options += more
+        elif opcode in [sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT]:
+            (low, high, repeated) = argument
+            if high > 1:
+                return None
+            options = expand_expression(repeated, limit)
+            if options is not None and low == 0:
+                options = [''] + options
+        elif opcode == sre_constants.IN:
+            options = []
+            for (in_opcode, in_argument) in argument:
+                if in_opcode == sre_constants.LITERAL:
+                    options.append(chr(in_argument))
+                elif in_opcode == sre_constants.RANGE:
+                    (low, high) = in_argument
+                    options += [chr(i) for i in range(low, high + 1)]
+                else:
+                    return None
+        else:
+            return None
+        if options is None:
+            return None
+        strings = [i + j for i in strings for j in options]
+        if len(strings) > limit:
+            return None
+    return strings
+
+
+def leading_words(expression):
+    """Return the set of words that can begin a match of the expression.
+
+    None indicates that the first word can't be determined, because the
+    expression is not a simple one or because it can match nothing at all."""
+    if len(expression) == 0 or expression[0].isupper():
+        return None
+    try:
+        strings = expand_expression(sre_parse.parse(expression))
+    except (sre_constants.error, ValueError):
+        return None
+    if strings is None:
+        return None
+    words = set()
+    for string in strings:
+        if len(string.split()) == 0:
+            return None
+        words.add(string.split()[0])
+    return words
+
+
+class Grammar(object):
+    """The command rules, compiled once and indexed by their first words.
+
+    Recognizing an input only requires checking the rules that can begin
+    with its first token, plus any rules whose first word is unknown. The
+    regular expressions needed to check each rule are compiled here, when
+    the Discourse is built, rather than during recognition."""
+
+    def __init__(self, commands):
+        self.commands = commands
+        self._compiled = {}
+        self._by_word = {}
+        self._any_word = []
+        for (position, (_, rule_list)) in enumerate(commands):
+            verb_part = rule_list[0]
+            if len(rule_list) == 1:
+                expressions = ['^' + verb_part + '$']
+            else:
+                expressions = [verb_part, '^' + verb_part + ' ']
+            for rule_piece in rule_list[1:]:
+                if not rule_piece[0].isupper():
+                    if not rule_piece[-1] == ' ':
+                        rule_piece += '(\\b|$)'
+                    expressions.append(rule_piece)
+            for expression in expressions:
+                try:
+                    self.pattern(expression)
+                except sre_constants.error:
+                    # Malformed rules in a fiction's grammar are left to
+                    # fail if and when they are actually used.
+                    pass
+            words = leading_words(verb_part)
+            if words is None:
+                self._any_word.append(position)
+            else:
+                for word in words:
+                    self._by_word.setdefault(word, []).append(position)
+
+    def pattern(self, expression):
+        'Return the compiled form of a regular expression used in the rules.'
+        if expression not in self._compiled:
+            self._compiled[expression] = re.compile(expression)
+        return self._compiled[expression]
+
+    def candidates(self, first_word):
+        'List, in grammar order, the rules that could match this first word.'
+        positions = self._by_word.get(first_word, []) + self._any_word
+        positions.sort()
+        return [self.commands[i] for i in positions]
+
+
 def zero_to_ten(point):
     'Maps a float with values of interest in (0.0, 1.0) to range(0,11).'
     digit = int(math.floor((point + .05) * 10))
@@ -245,8 +366,12 @@ class Discourse(object):
 
     debug = False
 
-    def __init__(self, discourse):
+    def __init__(self, discourse, seed=None):
         self.input_list = input_model.InputList()
+        # Narration that varies by chance draws on this session's own random
+        # number generator, so that the same seed gives the same narration.
+        self.seed = seed
+        self.random = random.Random(seed)
         self.narrated = {}
         self.spin = discourse['spin']
         self.initial_spin = discourse['spin']
@@ -259,8 +384,10 @@ class Discourse(object):
                 setattr(self, i, discourse[i])
         for i in ['command_grammar', 'compass', 'verb_representation']:
             if i in discourse:
-                for key, new_value in discourse[i].items():
-                    getattr(self, i)[key] = new_value
+                # Add to a copy, so that other Discourses keep the defaults.
+                combined = dict(getattr(self, i))
+                combined.update(discourse[i])
+                setattr(self, i, combined)
         self.givens = set()
         self.english_to_link = {}
         for (relation, names) in self.link_to_english.items():
@@ -272,6 +399,7 @@ class Discourse(object):
             for rule in self.command_grammar[action]:
                 rule_parts = splitoff(rule)
                 self.commands += [(action_parts, rule_parts)]
+        self.grammar = Grammar(self.commands)
         self.command_canonical = {}
         for action in self.command_grammar:
             verb = action.split()[0]
@@ -6,8 +6,6 @@ __license__ = 'ISC'
 __version__ = '0.5.0.0'
 __status__ = 'Development'
 
-from random import random, randint, choice
-
 from item_model import Actor, Door, Room, SharedThing, Substance, Thing
 from action_model import Behave, Configure, Modify, Sense
 from joker import update_spin
@@ -182,12 +180,12 @@ all_treasures = ['@nugget', '@diamonds', '@bars', '@jewelry', '@coins',
 
 interjections = ['uh', 'uh', 'uh', 'um', 'um', 'er']
 
-def double_template(phrases):
+def double_template(phrases, chance):
     new_phrases = []
     for phrase in phrases.split():
         new_phrases.append(phrase)
         if phrase[-3:] == '/o]':
-            new_phrases += ['and', choice(['the radiant being',
+            new_phrases += ['and', chance.choice(['the radiant being',
                 'the majestic presence', 'the tremendous aura',
                 'the incredible unity', 'the solemn physicality',
                 'the uplifting nature', 'the full existence',
@@ -197,50 +195,52 @@ def double_template(phrases):
                 'of', phrase]
     return ' '.join(new_phrases)
 
-def hesitant_sentence(phrases):
+def hesitant_sentence(phrases, chance):
     new_phrases = phrases[:1]
     for original in phrases[1:]:
-        if randint(1,6) == 1:
+        if chance.randint(1,6) == 1:
             if not new_phrases[-1][-1] in ',.:;':
                 new_phrases.append(',')
-            new_phrases.append(choice(interjections))
+            new_phrases.append(chance.choice(interjections))
             if not original[:1] in ',.:;':
                 new_phrases.append(',')
         new_phrases.append(original)
     return new_phrases
 
-def surprise_sentence(phrases):
-    chosen = randint(1,8)
+def surprise_sentence(phrases, chance):
+    chosen = chance.randint(1,8)
     if chosen == 1:
-        phrases = [choice(['whoa', 'dude']) + ','] + phrases
+        phrases = [chance.choice(['whoa', 'dude']) + ','] + phrases
     elif chosen == 2:
         if not phrases[-1][-1] in ',.:;':
             phrases[-1] += ','
-        phrases = phrases + [choice(['man', 'dude',])]
+        phrases = phrases + [chance.choice(['man', 'dude',])]
     phrases[-1] = phrases[-1] + '!'
     return phrases
 
-def surprise_paragraph(paragraphs):
-    chosen = randint(1,3)
+def surprise_paragraph(paragraphs, chance):
+    chosen = chance.randint(1,3)
     if chosen == 1:
-        paragraphs = paragraphs + choice(['Amazing!', 'Wow!', 'Awesome!',
-                                          'Out of this world!', 'Incredible!'])
+        paragraphs = paragraphs + chance.choice(['Amazing!', 'Wow!',
+                                                 'Awesome!',
+                                                 'Out of this world!',
+                                                 'Incredible!'])
     return paragraphs
 
-def valley_sentence(phrases):
+def valley_sentence(phrases, chance):
     new_phrases = phrases[:1]
     for original in phrases[1:]:
-        if randint(1,5) == 1:
+        if chance.randint(1,5) == 1:
             if not new_phrases[-1][-1] in ',.:;':
                 new_phrases.append(',')
             new_phrases.append('like')
             if not original in ',.:;':
                 new_phrases.append(',')
         new_phrases.append(original)
-    if len(new_phrases) > 0 and randint(1,6) == 1:
+    if len(new_phrases) > 0 and chance.randint(1,6) == 1:
         if not new_phrases[-1] in ',.:;':
             new_phrases.append(',')
-        new_phrases.append(choice(['totally', 'for sure']))
+        new_phrases.append(chance.choice(['totally', 'for sure']))
     return new_phrases
 
 variation = [
@@ -697,8 +697,8 @@ class Wanderer(Actor):
     'Not used, but could be used for the dwarves and the pirate.'
 
     def act(self, command_map, world):
-        if random() > .2 and len(self.exits(world)) > 0:
-            way = choice(self.exits(world).keys())
+        if world.random.random() > .2 and len(self.exits(world)) > 0:
+            way = world.random.choice(self.exits(world).keys())
             return [self.do_command('exit ' + way, command_map, world)]
 
 
@@ -10,7 +10,6 @@ __license__ = 'ISC'
 __version__ = '0.5.0.0'
 __status__ = 'Development'
 
-import random
 import time
 
 from item_model import Actor, Thing
@@ -83,26 +82,26 @@ class Distance_Filter:
         no_success = 1.0 - self.base_prob
         self.expression_prob = .5 * (1.0 - (no_success ** self.distance))
 
-    def sentence_filter(self, phrases):
-        pick = random.random()
+    def sentence_filter(self, phrases, chance):
+        pick = chance.random()
         if pick < self.expression_prob * .5:
-            prefix = [random.choice(self.prefixes)]
+            prefix = [chance.choice(self.prefixes)]
             time_words = []
             if phrases[0] in ['before that,', 'meanwhile,', 'then,']:
                 time_words = [phrases.pop(0)]
             phrases = time_words + prefix + phrases
         elif pick < self.expression_prob:
-            suffix = random.choice(self.suffixes)
+            suffix = chance.choice(self.suffixes)
             phrases.append(suffix)
         return phrases
 
-def sentence_filter(phrases):
+def sentence_filter(phrases, chance):
     new_phrases = phrases[:1]
     for original in phrases[1:]:
-        if randint(1,6) == 1:
+        if chance.randint(1,6) == 1:
             if not new_phrases[-1][-1] in ',.:;':
                 new_phrases.append(',')
-            new_phrases.append(choice(interjections))
+            new_phrases.append(chance.choice(interjections))
             if not original[:1] in ',.:;':
                 new_phrases.append(',')
         new_phrases.append(original)
@@ -162,6 +161,7 @@ class Cosmos(Actor):
                  concept.item['@visitor'].place(concept) )
             new_place = concept.item['@visitor'].place(concept)
             self.visitor_places.append(new_place)
+            self.mark_changed()
             if sum(self.visitor_moved[-1:]) > 0:
                 self.distance += 1
             else:
@@ -179,8 +179,8 @@ class Wanderer(Actor):
     '@visitor is the only instance. act() is used when commanded is None.'
 
     def act(self, command_map, concept):
-        if random.random() < self.walk_probability:
-            way = random.choice(self.place(concept).exits.keys())
+        if concept.random.random() < self.walk_probability:
+            way = concept.random.choice(self.place(concept).exits.keys())
             return [self.do_command(['leave', way], command_map, concept)]
         return []
 
@@ -192,8 +192,8 @@ class Collector(Actor):
         for (tag, link) in list(concept.item[str(self)].r(concept).child()):
             if link == 'in' and 'trash' in concept.item[tag].qualities:
                 return [self.do_command(['take', tag], command_map, concept)]
-        if random.random() < self.walk_probability:
-            way = random.choice(self.place(concept).exits.keys())
+        if concept.random.random() < self.walk_probability:
+            way = concept.random.choice(self.place(concept).exits.keys())
             return [self.do_command(['leave', way], command_map, concept)]
         return []
 
@@ -202,10 +202,10 @@ class Kicker(Actor):
     'Not used! @punk uses a deterministic script instead.'
 
     def act(self, command_map, concept):
-        if random.random() < self.walk_probability:
-            way = random.choice(self.place(concept).exits.keys())
+        if concept.random.random() < self.walk_probability:
+            way = concept.random.choice(self.place(concept).exits.keys())
             return [self.do_command(['leave', way], command_map, concept)]
-        elif random.random() < self.kick_probability:
+        elif concept.random.random() < self.kick_probability:
             for (tag, link) in concept.item[str(self)].r(concept).child():
                 if link == 'part_of':
                     return [self.do_command(['kick', tag], command_map,
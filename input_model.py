@@ -51,6 +51,9 @@ class InputList(object):
     def __init__(self):
         self._all = []
         self._traversal_start = 0
+        # Each line typed, including answers to the clarifier's questions,
+        # so that the session can be played again from the beginning.
+        self.lines = []
 
     def _count(self, category):
         """Counts only those inputs in the specified category.
@@ -62,6 +65,10 @@ class InputList(object):
                          if getattr(i, category)])
         return (session, traversal)
 
+    def add_line(self, line):
+        'Adds a line exactly as it was typed.'
+        self.lines.append(line)
+
     def latest_command(self):
         'Returns the most recently entered command.'
         i = len(self._all) - 1
@@ -70,6 +77,10 @@ class InputList(object):
                 return self._all[i]
             i -= 1
 
+    def since(self, number):
+        'Returns the inputs added after the first number of them.'
+        return self._all[number:]
+
     def update(self, user_input):
         'Adds an input.'
         self._all.append(user_input)
@@ -6,13 +6,34 @@ __license__ = 'ISC'
 __version__ = '0.5.0.0'
 __status__ = 'Development'
 
+import copy
+import itertools
 import random
 import re
 import types
+import uuid
 
 import can
 import discourse_model
 
+# Each change to an Item gives it a new version. Copies keep the version, so
+# an Item and its copy are known to be equal until either one changes. A
+# version is this process's epoch with a number counted within the process,
+# so Items restored from a save made by another process never share a
+# version with Items made here.
+EPOCH = uuid.uuid4().hex
+VERSION = itertools.count(1)
+
+# If True, whenever two Items are found equal because they have the same
+# version, they are also compared feature by feature, and an AssertionError
+# is raised if they differ: some feature was changed in place without a call
+# to Item.mark_changed.
+CHECK_VERSIONS = False
+
+def new_version():
+    'Return a version that no Item has had.'
+    return (EPOCH, VERSION.next())
+
 def check_attributes(identifier, required, impossible, attributes):
     'Raise errors if required attributes are missing or impossile ones present.'
     some_wrong = ''
@@ -163,8 +184,26 @@ def set_features(item, category, keywords):
         setattr(item, name, value)
     return item
 
+# The core fields of every Item, kept in slots rather than in a dictionary.
+ITEM_CORE = ['_tag', 'link', 'parent', '_children', 'actor', 'door', 'room',
+             'thing', 'substance', 'blanked', '_called', '_gender', '_number',
+             '_referring_extra', '_qualities', '_referring', '_sense',
+             '_version', 'article', 'glow', 'prominence', 'transparent',
+             'mention', 'allowed', 'shared']
+
 class Item(object):
-    'Abstract base class for items.'
+    """Abstract base class for items.
+
+    Setting a feature gives an Item a new version; copies share the version
+    until one of them changes. A feature changed in place, such as a list
+    that is appended to, does not, so code that does this must then call
+    mark_changed(). Otherwise, copies of the Item held in Concepts are taken
+    to be up to date when they are not. See CHECK_VERSIONS."""
+
+    # Core fields are in slots. Other features are in the Item's dictionary,
+    # which is only created when needed, so that subclasses in fictions can
+    # add any features they like.
+    __slots__ = ITEM_CORE + ['__dict__', '__weakref__']
 
     def __init__(self, tag_and_parent, category, **keywords):        
         if self.__class__ == Item:
@@ -212,11 +251,41 @@ class Item(object):
     def __str__(self):
         return self._tag
 
+    def __getstate__(self):
+        'Return the core fields and other features, for copying and saving.'
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', []):
+                if not name[:2] == '__' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        'Restore the Item, keeping its version.'
+        for (name, value) in state.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_version', new_version())
+
     def __eq__(self, item):
         if item is None:
             return False
         if type(item) == types.StringType:
             return str(self) == item
+        version = getattr(self, '_version', None)
+        if version is not None and version == getattr(item, '_version', None):
+            # One is a copy of the other and neither has changed since.
+            assert not CHECK_VERSIONS or self.same_features(item), (
+                   'The Item "' + str(self) + '" was changed in place ' +
+                   'without a call to mark_changed.')
+            return True
+        return self.same_features(item)
+
+    def same_features(self, item):
+        'Compare this Item to another one feature by feature.'
         self_list = [str(self), self.article, self.called]
         item_list = [str(item), item.article, item.called]
         equal_attrs = (set(dir(self)) == set(dir(item)))
@@ -270,6 +339,7 @@ class Item(object):
         return self._sense['sight']
     def set_sight(self, string):
         self._sense['sight'] = discourse_model.reformat(string)
+        self.mark_changed()
     sight = property(get_sight, set_sight,
                      'What is seen when an Item is looked at.')
 
@@ -278,6 +348,7 @@ class Item(object):
     def set_touch(self, string):
         'Setter. Needed because strings must be reformatted before being set.'
         self._sense['touch'] = discourse_model.reformat(string)
+        self.mark_changed()
     touch = property(get_touch, set_touch,
                      'What is felt when an Item is touched.')
 
@@ -285,6 +356,7 @@ class Item(object):
         return self._sense['hearing']
     def set_hearing(self, string):
         self._sense['hearing'] = discourse_model.reformat(string)
+        self.mark_changed()
     hearing = property(get_hearing, set_hearing,
                        'What is heard when an Item is listened to.')
 
@@ -292,6 +364,7 @@ class Item(object):
         return self._sense['smell']
     def set_smell(self, string):
         self._sense['smell'] = discourse_model.reformat(string)
+        self.mark_changed()
     smell = property(get_smell, set_smell,
                      'What is smelled when an Item is sniffed.')
 
@@ -299,6 +372,7 @@ class Item(object):
         return self._sense['taste']
     def set_taste(self, string):
         self._sense['taste'] = discourse_model.reformat(string)
+        self.mark_changed()
     taste = property(get_taste, set_taste,
                      'What is tasted when an Item is sampled.')
 
@@ -350,11 +424,14 @@ class Item(object):
                     length=0.0):
         'Return the noun phrase representing this Item.'
         string = self.called[1]
+        chance = random
+        if discourse is not None:
+            chance = discourse.random
         if len(self.called[0]) > 0 and length > 0.0:
-            before_adjs = random.choice(self.called[0] + [''])
+            before_adjs = chance.choice(self.called[0] + [''])
             string = (before_adjs + ' ' + string).strip()
         if len(self.called[2]) > 0 and length > 0.0:
-            after_adjs = random.choice(self.called[2] + [''])
+            after_adjs = chance.choice(self.called[2] + [''])
             string = (string + ' ' + after_adjs).strip()
         string = (extra_adjs + ' ' + string).strip()
         if discourse is None:
@@ -384,6 +461,10 @@ class Item(object):
             tag = world.item[tag].parent
         return world.item[tag]
 
+    def mark_changed(self):
+        'Give the Item a new version after changing one of its features.'
+        object.__setattr__(self, '_version', new_version())
+
     @property
     def children(self):
         'Return the children of this Item.'
@@ -396,6 +477,14 @@ class Item(object):
         else:
             if (link, item) not in self._children:
                 self._children.append((link, item))
+                self.mark_changed()
+
+    def with_child(self, link, item):
+        'Return a copy of this Item with a new child, sharing other features.'
+        new_item = copy.copy(self)
+        new_item._children = list(self._children)
+        new_item.add_child(link, item)
+        return new_item
 
     def remove_child(self, link, item, making_change=True):
         'Remove (or add) a child from this Item.'
@@ -404,6 +493,7 @@ class Item(object):
         else:
             if (link, item) in self._children:
                 self._children.remove((link, item))
+                self.mark_changed()
 
     def prevent(self, _, __):
         'By default, items do not prevent actions Subclasses can override.'
@@ -435,6 +525,8 @@ class Actor(Item):
         not the refusal will take place given a match; and the final string
         is a template used to generate a message explaining the refusal."""
 
+    __slots__ = ['alive', 'refuses']
+
     def __init__(self, tag_and_parent, **keywords):
         if 'alive' not in keywords:
             self.alive = True
@@ -455,6 +547,7 @@ class Actor(Item):
             next_command = self.script.pop(0)
             if hasattr(self, 'script_loops'):
                 self.script.append(next_command)
+            self.mark_changed()
             next_command = next_command.split()
             return [self.do_command(next_command, command_map, concept)]
         return []
@@ -507,6 +600,8 @@ class Room(Item):
         number in (0, 1)) and a string which is used to generate a textual
         description of the direction of that room."""
 
+    __slots__ = ['exits', 'view']
+
     def __init__(self, tag, **keywords):
         check_attributes(tag, ['exits'], ['parent'], keywords)
         tag_and_parent = tag + ' of @cosmos'
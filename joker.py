@@ -6,10 +6,18 @@ __license__ = 'ISC'
 __version__ = '0.5.0.0'
 __status__ = 'Development'
 
+import copy
+import cPickle
+import glob
+import hashlib
+import json
 import os
-import pickle
 import re
+import sys
+import zlib
 
+import action_model
+import command_map
 import discourse_model
 import microplanner
 import reply_planner
@@ -65,6 +73,8 @@ MESSAGE = {
 
     'quitting': 'This ends the session.',
 
+    'recovered': 'The session has been recovered from its journal, [].',
+
     'recounting': 'Recounting the specified actions.',
 
     'restarted': 'The session has been restarted.',
@@ -119,6 +129,14 @@ MESSAGE = {
     'wrap': '[]'}
 
 
+# Save files begin with this line, then a line with the format's number.
+SAVE_HEADING = 'Curveship session\n'
+SAVE_FORMAT = 1
+
+# A session with fewer lines than this is saved without a snapshot, since
+# playing it again is quick and writing the snapshot is not.
+SNAPSHOT_LINES = 100
+
 class StartupError(Exception):
     'Exception occuring during session startup or in loading a spin.'
     def __init__(self, msg):
@@ -126,9 +144,22 @@ class StartupError(Exception):
         Exception.__init__(self, msg)
 
 
-def load_file(file_name, required, defaults, module_type):
+def package_modules(module_name):
+    'Returns the names of loaded modules in the same package as this one.'
+    package = module_name.split('.')[0]
+    return [name for name in sys.modules.keys() if
+            name == module_name or name.startswith(package + '.')]
+
+
+def load_file(file_name, required, defaults, module_type, modules=None):
     """Loads either an interactive fiction or a spin file.
 
+    If a dictionary of modules is given, the file is loaded anew even if it
+    was loaded before, so that its Items, Actions, and dictionaries are not
+    shared with earlier sessions. So are other modules in its package that it
+    imports, such as another fiction it builds on. These modules are added
+    to the dictionary, which must be kept for as long as they are used.
+
     Improved filename parsing thanks to Max Battcher."""
     dirname, _ = os.path.splitext(file_name)
     pieces = []
@@ -140,6 +171,9 @@ def load_file(file_name, required, defaults, module_type):
             break
     pieces.reverse()
     module_name = '.'.join(pieces)
+    if modules is not None:
+        for name in package_modules(module_name):
+            del sys.modules[name]
     try:
         mod = __import__(module_name, globals(), locals(), required, -1)
         for attr in required:
@@ -151,24 +185,29 @@ def load_file(file_name, required, defaults, module_type):
         for (attr, default) in defaults.items():
             module = __import__(module_name, globals(), locals(), [attr])
             if not hasattr(module, attr):
-                setattr(module, attr, default)
+                setattr(module, attr, copy.copy(default))
     except ImportError, err:
         msg = ('Unable to open '+ module_type + ' module "' + module_name +
                '" due to this error: ' + str(err))
         raise StartupError(msg)
+    if modules is not None:
+        for name in package_modules(module_name):
+            modules[name] = sys.modules[name]
     return module
 
 
-def load_fiction(file_name, required, defaults):
+def load_fiction(file_name, required, defaults, modules=None):
     'Loads a fiction file.'
-    fiction = load_file(file_name, required, defaults, 'interactive fiction')
+    fiction = load_file(file_name, required, defaults, 'interactive fiction',
+                        modules)
     return fiction
 
-def load_spin(existing_spin, spin_file):
+def load_spin(existing_spin, spin_file, modules=None):
     'Loads one spin file and returns an updated spin.'
     focalizer = existing_spin['focalizer']
     commanded = existing_spin['commanded']
-    new_file = load_file(spin_file, [], discourse_model.SPIN_DEFAULTS, 'spin')
+    new_file = load_file(spin_file, [], discourse_model.SPIN_DEFAULTS, 'spin',
+                         modules)
     if hasattr(new_file, 'spin'):
         existing_spin = update_spin(existing_spin, new_file.spin)
     return existing_spin
@@ -565,16 +604,145 @@ def restart(_, world, discourse):
     return (report('restarted'), None, world, discourse)
 
 
-def restore(tokens, world, discourse):
+def session_record(discourse):
+    'Return what is needed, besides the lines typed, to play a session again.'
+    return {'version': __version__,
+            'fiction': discourse.fiction_file,
+            'spins': discourse.spin_files,
+            'debug': discourse.debug,
+            'seed': discourse.seed}
+
+
+def code_digest(record):
+    """Return a digest of the code that a snapshot of the session relies on.
+
+    This is the source of Curveship's own modules and of every module in the
+    directories of the session's fiction and spin files, which includes any
+    fiction that one builds on. A snapshot is only used if the code is the
+    same when it is read."""
+    directories = set([os.path.dirname(os.path.abspath(__file__))])
+    for file_name in [record['fiction']] + record['spins']:
+        directories.add(os.path.dirname(os.path.abspath(file_name)))
+    digest = hashlib.sha1()
+    for directory in sorted(directories):
+        for file_name in sorted(glob.glob(os.path.join(directory, '*.py'))):
+            source = file(file_name, 'rb')
+            try:
+                digest.update(source.read())
+            finally:
+                source.close()
+    return digest.hexdigest()
+
+
+def session_digest(discourse, record=None):
+    """Return the digest of the session's code, finding it only once.
+
+    The digest is kept in the Discourse. If a record of some session is
+    given, the digest is for its code, which is the session's own only if
+    the record names the same fiction and spin files."""
+    own = session_record(discourse)
+    if record is not None and not (record['fiction'] == own['fiction'] and
+                                   record['spins'] == own['spins']):
+        return code_digest(record)
+    if getattr(discourse, 'code', None) is None:
+        discourse.code = code_digest(own)
+    return discourse.code
+
+
+def write_session(file_name, world, discourse, snapshot=None):
+    """Write a record of the session to a file.
+
+    After a heading and the format's number comes a line of JSON with the
+    fiction and spin files the session began with and each line typed since
+    then. With snapshot, the compressed World and Discourse follow, so that
+    the session can be restored without playing it again; the record then
+    has a digest of the code. If snapshot is None, there is one only if the
+    session has SNAPSHOT_LINES lines. A snapshot includes every Action done
+    so far, since narrating and undoing them need them, so it grows as the
+    session goes on."""
+    record = session_record(discourse)
+    record['lines'] = discourse.input_list.lines
+    if snapshot is None:
+        snapshot = len(record['lines']) >= SNAPSHOT_LINES
+    if snapshot:
+        record['code'] = session_digest(discourse)
+    save_file = file(file_name, 'wb')
+    try:
+        save_file.write(SAVE_HEADING + str(SAVE_FORMAT) + '\n')
+        save_file.write(json.dumps(record) + '\n')
+        if snapshot:
+            save_file.write(zlib.compress(cPickle.dumps((world, discourse),
+                                          cPickle.HIGHEST_PROTOCOL)))
+    finally:
+        save_file.close()
+
+
+def read_session(file_name, commands=command_map, modules=None,
+                 discourse=None):
+    """Return the World and Discourse of a session that was written to a file.
+
+    The snapshot is used if there is one made with the same code; otherwise,
+    the session is played again from the lines typed, with the session's
+    command mappings. If the session keeps its modules in a dictionary, a
+    snapshot is read using those modules, and a session played again
+    replaces them with the ones it loads. The Discourse of the session doing
+    the reading, if given, supplies the digest of its code. Files saved by
+    versions of Curveship before sessions were recorded, which have only a
+    pickled World and Discourse, are not read; they raise ValueError."""
+    save_file = file(file_name, 'rb')
+    try:
+        if not save_file.readline() == SAVE_HEADING:
+            raise ValueError('The file is from an earlier version of ' +
+                             'Curveship.')
+        if int(save_file.readline()) > SAVE_FORMAT:
+            raise ValueError('The file is from a later version of Curveship.')
+        record = json.loads(save_file.readline())
+        snapshot = save_file.read()
+    finally:
+        save_file.close()
+    if discourse is None:
+        code = code_digest(record)
+    else:
+        code = session_digest(discourse, record)
+    if len(snapshot) > 0 and record.get('code') == code:
+        if modules is not None:
+            # So that the Items are of the session's own classes.
+            sys.modules.update(modules)
+        (world, discourse) = cPickle.loads(zlib.decompress(snapshot))
+        discourse.code = code
+        continue_numbering(world)
+        return (world, discourse)
+    # Imported here because curveship imports this module.
+    import curveship
+    rebuilt = {}
+    (world, discourse) = curveship.rebuild(record, commands, rebuilt)
+    discourse.code = code
+    if modules is not None:
+        modules.clear()
+        modules.update(rebuilt)
+    return (world, discourse)
+
+
+def continue_numbering(world):
+    'Have new Actions numbered after those of a World that has been restored.'
+    ids = world.act.keys()
+    for concept in world.concept.values():
+        ids.extend(concept.act.keys())
+    action_model.ACTION_ID = action_model.generator(max([0] + ids) + 1)
+
+
+def restore(tokens, world, discourse, commands=command_map, modules=None):
     'Restores the game and emit an appropriate report.'
+    if getattr(discourse, 'rebuilding', False):
+        # The session is being played again up to the point it was saved.
+        return (None, None, world, discourse)
     if len(tokens) > 1 and re.match('[a-zA-Z_0-9]+$', tokens[1]):
         try:
-            file_name = 'save/' + tokens[1] + '.ses'
-            restore_file = file(file_name, 'r')
-            (world, discourse) = pickle.load(restore_file)
-            restore_file.close()
+            (world, discourse) = read_session('save/' + tokens[1] + '.ses',
+                                              commands, modules, discourse)
             report_text = report('restored')
-        except IOError:
+        except (IOError, ValueError, KeyError, EOFError, zlib.error,
+                cPickle.UnpicklingError, StartupError):
             report_text = report('restore_error')
     else:
         report_text = report('restore_usage')
@@ -591,12 +759,17 @@ def room_name(_, world, discourse):
 
 def save(tokens, world, discourse):
     'Save the fiction/game/world and emit an appropriate report.'
+    if getattr(discourse, 'rebuilding', False):
+        return (None, None, world, discourse)
     if len(tokens) > 1 and re.match('[a-z_0-9]+$', tokens[1]):
+        file_name = 'save/' + tokens[1] + '.ses'
         try:
-            file_name = 'save/' + tokens[1] + '.ses'
-            save_file = file(file_name, 'w')
-            pickle.dump((world, discourse), save_file)
-            save_file.close()
+            try:
+                write_session(file_name, world, discourse)
+            except cPickle.PicklingError:
+                # Items from a fiction that another session has since loaded
+                # anew cannot be pickled, but the lines typed can be saved.
+                write_session(file_name, world, discourse, snapshot=False)
             report_text = report('saved')
         except IOError:
             report_text = report('save_error')   
@@ -646,8 +819,10 @@ def undo(tokens, world, discourse):
                 command_to_undo = discourse.input_list.latest_command()
                 report_text += report('undone', str(command_to_undo))
                 discourse.input_list.undo()
-                world.undo(command_to_undo.caused)
                 undone += 1
+            # Going back to the earliest command undone also undoes the
+            # later ones, so the World and Concepts are rolled back once.
+            world.undo(command_to_undo.caused)
     except ValueError:
         report_text = report('undo_usage')
     return (report_text, None, world, discourse)
@@ -671,10 +846,16 @@ def world_info(tokens, world, discourse):
     return (report_text, None, world, discourse)
 
 
-def joke(tokens, world, discourse):
-    'Handles directives -- inputs that deal with the program state.'
+def joke(tokens, world, discourse, commands=command_map, modules=None):
+    """Handles directives -- inputs that deal with the program state.
+
+    Restore, which replaces the session, is also given the session's command
+    mappings and modules."""
     head = tokens[0].lower()
-    if head in globals():
+    if head == 'restore':
+        (report_text, reply_text, world,
+         discourse) = restore(tokens, world, discourse, commands, modules)
+    elif head in globals():
         (report_text, reply_text, world,
          discourse) = globals()[head](tokens, world, discourse)
     else:
@@ -0,0 +1,123 @@
+'Keep an append-only journal of a session, so that it can be recovered.'
+
+__author__ = 'Nick Montfort'
+__copyright__ = 'Copyright 2011 Nick Montfort'
+__license__ = 'ISC'
+__version__ = '0.5.0.0'
+__status__ = 'Development'
+
+import cPickle
+import json
+import os
+
+import joker
+
+# How many lines the command-line interface plays between snapshots.
+SNAPSHOT_EVERY = 50
+
+class Journal(object):
+    """Appends each line typed in a session to a file, turn by turn.
+
+    The file has one JSON object per line. A "session" entry gives the
+    fiction and spin files and whether debugging directives are enabled, and
+    each "line" entry after it is a line that was typed. When another session
+    is restored from a save file, a new "session" entry is written, followed
+    by all of the lines of the restored session. An "end" entry is written
+    when the session is over.
+
+    If snapshot_every is given, the whole session is also saved to a file
+    beside the journal after that many lines, so that recovering it does not
+    mean playing every line again. Each later snapshot waits for as many
+    lines again as the session had at the one before, if that is more, so
+    that the snapshots of a long session do not take longer and longer in
+    all."""
+
+    def __init__(self, file_name, snapshot_every=None):
+        self.file_name = file_name
+        self.snapshot_every = snapshot_every
+        self.snapshot_after = snapshot_every
+        self.journal_file = file(file_name, 'a')
+        # The list of lines in the Discourse, and how many have been written.
+        self.lines = None
+        self.written = 0
+        self.unsaved = 0
+
+    def write(self, entry):
+        'Append one entry to the journal.'
+        self.journal_file.write(json.dumps(entry) + '\n')
+
+    def update(self, world, discourse):
+        """Append the lines typed since the last update.
+
+        The journal is flushed to disk, so these lines survive a crash."""
+        lines = discourse.input_list.lines
+        if lines is not self.lines or len(lines) < self.written:
+            self.write({'session': joker.session_record(discourse)})
+            self.lines = lines
+            self.written = 0
+        for line in lines[self.written:]:
+            self.write({'line': line})
+        self.unsaved += len(lines) - self.written
+        self.written = len(lines)
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        if (self.snapshot_every is not None and
+            self.unsaved >= self.snapshot_after):
+            self.snapshot(world, discourse)
+
+    def snapshot(self, world, discourse):
+        'Save the whole session, replacing the previous snapshot at once.'
+        temporary = snapshot_name(self.file_name) + '.new'
+        try:
+            joker.write_session(temporary, world, discourse, snapshot=True)
+        except cPickle.PicklingError:
+            # Recovery will play the lines in the journal instead.
+            return
+        os.rename(temporary, snapshot_name(self.file_name))
+        self.unsaved = 0
+        self.snapshot_after = max(self.snapshot_every,
+                                  len(discourse.input_list.lines))
+
+    def continue_from(self, discourse):
+        'Go on from a session recovered from this journal.'
+        self.lines = discourse.input_list.lines
+        self.written = len(self.lines)
+
+    def end(self):
+        'Note that the session is over and close the journal.'
+        self.write({'end': True})
+        self.close()
+
+    def close(self):
+        'Close the journal, leaving the session to be recovered later.'
+        self.journal_file.close()
+
+
+def snapshot_name(file_name):
+    'Return the name of the snapshot file kept beside a journal.'
+    return file_name + '.ses'
+
+
+def read_journal(file_name):
+    """Return a record of the session in a journal, or None if it is over.
+
+    The record is that of the latest "session" entry, with the "lines"
+    typed after it. An entry cut off by a crash is ignored."""
+    record = None
+    journal_file = file(file_name, 'r')
+    try:
+        for text in journal_file:
+            try:
+                entry = json.loads(text)
+            except ValueError:
+                break
+            if 'session' in entry:
+                record = entry['session']
+                record['lines'] = []
+            elif 'line' in entry and record is not None:
+                record['lines'].append(entry['line'])
+            elif 'end' in entry:
+                record = None
+    finally:
+        journal_file.close()
+    return record
@@ -6,11 +6,11 @@ __license__ = 'ISC'
 __version__ = '0.5.0.0'
 __status__ = 'Development'
 
-import random
 import re
 import types
 
 import reply_planner
+import tracing
 from realizer import Section, Paragraph, Heading
 
 def has_final(node):
@@ -24,6 +24,7 @@ def has_final(node):
     return final
 
 
+@tracing.traced('microplanner.specify')
 def specify(reply_plan, concept, discourse):
     'Main microplanner invocation, returns blocks wrapped up as a section.'
     blocks = micro(reply_plan, concept, discourse, discourse.min,
@@ -70,7 +71,7 @@ def micro(reply_node, concept, discourse, ref, speech):
             blocks = name_room(reply_node, e_r, r_s, concept, discourse)
         elif reply_node.category == 'commentary':
             para = Paragraph(discourse.spin['template_filter'],
-                             [reply_node.info])
+                             [reply_node.info], chance=discourse.random)
             para.set(discourse.spin['narrator'], discourse.spin['narratee'],
                      'simple', 'present', discourse.spin['progressive'])
             blocks = [para]
@@ -87,7 +88,8 @@ def micro(reply_node, concept, discourse, ref, speech):
 def acknowledge(tense_er, tense_rs, _, discourse, __):
     'Produces a rather empty utterance when there is nothing to represent.'
     template = 'nothing special [happen/1/v]'
-    para = Paragraph(discourse.spin['template_filter'], [template])
+    para = Paragraph(discourse.spin['template_filter'], [template],
+                     chance=discourse.random)
     para.set(discourse.spin['narrator'], discourse.spin['narratee'],
              tense_er, tense_rs, discourse.spin['progressive'])
     return [para]
@@ -99,33 +101,34 @@ def name_room(node, tense_er, tense_rs, concept_now, discourse):
     concept = concept_now.copy_at(time)
     room = concept.room_of(agent)
     template = '[' + agent + '/s] [is/v] in ' + room.noun_phrase(discourse)
-    para = Paragraph(discourse.spin['template_filter'], [template], time)
+    para = Paragraph(discourse.spin['template_filter'], [template], time,
+                     discourse.random)
     para.set(discourse.spin['narrator'], discourse.spin['narratee'], tense_er,
               tense_rs, discourse.spin['progressive'])
     blocks = [para]
     return blocks
 
 
-def select(string_or_list):
+def select(string_or_list, discourse):
     'Return a string, either the one passed or a randome element from a list.'
     if type(string_or_list) == types.StringType:
         return string_or_list
     else:
-        return random.choice(string_or_list)
+        return discourse.random.choice(string_or_list)
 
 
 def get_representation(action, discourse):
     'Returns the appropriate representation of an action.'
     verb = action.verb
     if verb in discourse.verb_representation:
-        template = select(discourse.verb_representation[verb])
+        template = select(discourse.verb_representation[verb], discourse)
     else:
         template = None
         if hasattr(action, 'template'):
-            template = select(action.template)
+            template = select(action.template, discourse)
         for (rule, possible_template) in discourse.action_templates:
             if action.match_string(rule):
-                template = select(possible_template)
+                template = select(possible_template, discourse)
                 break
         if template is None:
             template = '[agent/s] [' + verb + '/v]'
@@ -221,7 +224,8 @@ def narrate_action(node, concept_now, discourse, tense_er, tense_rs):
             strings = [node.info.before] + strings
         if hasattr(node.info, 'after'):
             strings += [node.info.after]
-    para = Paragraph(discourse.spin['template_filter'], strings, time)
+    para = Paragraph(discourse.spin['template_filter'], strings, time,
+                     discourse.random)
     para.set(discourse.spin['narrator'], discourse.spin['narratee'], tense_er,
              tense_rs, discourse.spin['progressive'])
     blocks = [para]
@@ -240,26 +244,29 @@ def narrate_action(node, concept_now, discourse, tense_er, tense_rs):
                 sense[0] = ('[*/s] [' +
                             discourse.sense_verb[node.info.modality] + '/v] ' +
                             sense[0])
-                para = Paragraph(discourse.spin['template_filter'], sense, time)
+                para = Paragraph(discourse.spin['template_filter'], sense,
+                                 time, discourse.random)
                 para.set(discourse.spin['narrator'],
                          discourse.spin['narratee'], tense_er, tense_rs,
                          discourse.spin['progressive'])
                 blocks += [para]
-    blocks = prepend_any_time_words(blocks, node, discourse.spin['time_words'])
+    blocks = prepend_any_time_words(blocks, node, discourse)
     return blocks
 
 
-def prepend_any_time_words(blocks, node, use_time_words):
+def prepend_any_time_words(blocks, node, discourse):
     'Add the appropirate time phrase at the start of the first sentence.'
-    if use_time_words and node.prior is not None:
+    if discourse.spin['time_words'] and node.prior is not None:
         time_words = 'then,'
         if node.event == node.prior:
             time_words = 'meanwhile,'
         elif node.event < node.prior:
-            time_words = random.choice(['before that,', 'previously,',
-                                        'previous to that,', 'that was after',
-                                        'earlier,', 'just beforehand,',
-                                        'a moment before'])
+            time_words = discourse.random.choice(['before that,',
+                                                  'previously,',
+                                                  'previous to that,',
+                                                  'that was after', 'earlier,',
+                                                  'just beforehand,',
+                                                  'a moment before'])
         if (len(blocks) > 0 and hasattr(blocks[0], 'sentences') and
             len(blocks[0].sentences) > 0):
             blocks[0].sentences[0].prepend(time_words)
@@ -302,7 +309,8 @@ def describe(tag, tense_er, tense_rs, speed, concept, discourse, sensor, time):
             current_sentences.append(re.sub('\[\*', '[' + sensor, string))
         elif len(current_sentences) > 0:
             description_block += [Paragraph(discourse.spin['template_filter'],
-                                            current_sentences, time)]
+                                            current_sentences, time,
+                                            discourse.random)]
             current_sentences = []
     for paragraph in description_block:
         paragraph.set(discourse.spin['narrator'], discourse.spin['narratee'],
@@ -376,13 +384,14 @@ def describe(tag, tense_er, tense_rs, speed, concept, discourse, sensor, time):
         blocks += [Heading(heading)]
     blocks += description_block
     if contents is not None:
-        para = Paragraph(discourse.spin['template_filter'], contents, time)
+        para = Paragraph(discourse.spin['template_filter'], contents, time,
+                         discourse.random)
         para.set(discourse.spin['narrator'], discourse.spin['narratee'],
                  tense_er, tense_rs, discourse.spin['progressive'])
         blocks += [para]
     if len(in_directions) > 0 and speed < 0.8:
         far_off = Paragraph(discourse.spin['template_filter'], in_directions,
-                            time)
+                            time, discourse.random)
         far_off.set(discourse.spin['narrator'], discourse.spin['narratee'],
                     tense_er, tense_rs, discourse.spin['progressive'])
         blocks += [far_off]
@@ -8,15 +8,21 @@ __status__ = 'Development'
 
 import os
 import re
+import signal
 import struct
 
+# The terminal size last found, as (cols, rows). It is kept until the
+# terminal is resized or the next turn begins.
+TERMINAL_SIZE = []
+
 def ioctl_term_size(filed):
     'Attempt to find terminal dimensions using an IO Control system call.'
     try:
         import fcntl, termios
         packed = fcntl.ioctl(filed, termios.TIOCGWINSZ, '1234')
         rows_cols = struct.unpack('hh', packed)
-    except ImportError:
+    except (ImportError, IOError):
+        # IOError is raised if the file is not a terminal, e.g., a pipe.
         return None
     if rows_cols == (0, 0):
         return None
@@ -34,7 +40,7 @@ def terminal_size():
             filed = os.open(os.ctermid(), os.O_RDONLY)
             rows_cols = ioctl_term_size(filed)
             os.close(filed)
-        except AttributeError:
+        except (AttributeError, OSError):
             pass
     if not rows_cols:
         # Some shells may set these environment variables.
@@ -42,23 +48,60 @@ def terminal_size():
     return int(rows_cols[1]), int(rows_cols[0]) # Reverses it to cols, rows.
 
 
+def current_terminal_size():
+    'Return the terminal size, finding it only if it may have changed.'
+    if len(TERMINAL_SIZE) == 0:
+        TERMINAL_SIZE.append(terminal_size())
+    return TERMINAL_SIZE[0]
+
+
+def forget_terminal_size(*_):
+    'Find the terminal size again when it is next needed.'
+    del TERMINAL_SIZE[:]
+
+
+def watch_terminal_size():
+    """Find the terminal size again whenever the terminal is resized.
+
+    Where the system does not signal this, the size is still found again
+    at the start of each turn."""
+    if hasattr(signal, 'SIGWINCH'):
+        signal.signal(signal.SIGWINCH, forget_terminal_size)
+        # Reading input goes on, rather than failing, if this is signaled.
+        signal.siginterrupt(signal.SIGWINCH, False)
+
+
+def columns(out_streams):
+    "Return the width set for the output streams, or else the terminal's."
+    width = getattr(out_streams, 'width', None)
+    if width is None:
+        (width, _) = current_terminal_size()
+    return width
+
+
 def _break_words(string, char_limit):
-    'Lineate the string based on the passed-in character limit.'
-    if len(string) <= char_limit:
-        next_line = string
-        string = ''
-    elif '\n' in string[0:char_limit]:
-        first_newline = string.index('\n')
-        next_line = string[0:first_newline]
-        string = string[(first_newline + 1):]
-    elif ' ' not in string[0:char_limit]:
-        next_line = string[0:char_limit]
-        string = string[char_limit:]
-    else:
-        last_space = string[0:char_limit].rindex(' ')
-        next_line = string[0:last_space]
-        string = string[(last_space + 1):]
-    return (next_line, string)
+    """Lineate the string based on the passed-in character limit.
+
+    Lines are produced one at a time. The string is only searched, never
+    sliced other than to make each line, so the time taken is linear."""
+    start = 0
+    while start < len(string):
+        end = start + char_limit
+        if len(string) <= end:
+            yield string[start:]
+            return
+        newline = string.find('\n', start, end)
+        if newline >= 0:
+            yield string[start:newline]
+            start = newline + 1
+        else:
+            last_space = string.rfind(' ', start, end)
+            if last_space < 0:
+                yield string[start:end]
+                start = end
+            else:
+                yield string[start:last_space]
+                start = last_space + 1
 
 
 def present(string, out_streams, pre='', post='\n\n'):
@@ -68,30 +111,23 @@ def present(string, out_streams, pre='', post='\n\n'):
     if string[-1:] == '\n':
         post = re.sub('^[ \t]+', '', post)
     string = pre + string + post
-    while len(string) > 0:
-        (cols, _) = terminal_size()
-        (next_line, string) = _break_words(string, cols)
+    lines = _break_words(string, columns(out_streams))
+    out_streams.write(lines.next())
+    for next_line in lines:
+        out_streams.write('\n')
         out_streams.write(next_line)
-        if len(string) > 0:
-            out_streams.write('\n')
-    out_streams.write(string)
 
 
 def center(string, out_streams, pre='', post='\n'):
     'Center the output and print it to the output streams.'
     string = pre + string + post
-    (cols, _) = terminal_size()
-    while len(string) > 0:
-        (next_line, string) = _break_words(string, cols)
-        while len(next_line) > 0 and next_line[0] == '\n':
-            out_streams.write('\n')
-            next_line = next_line[1:]
-        spaces = ''
-        i = 1
-        while i <= (cols - len(next_line))/2:
-            spaces += ' '
-            i += 1
-        out_streams.write(' ' + spaces + next_line)
-        if len(string) > 0:
+    cols = columns(out_streams)
+    first = True
+    for next_line in _break_words(string, cols):
+        if not first:
             out_streams.write('\n')
-
+        first = False
+        text = next_line.lstrip('\n')
+        out_streams.write('\n' * (len(next_line) - len(text)))
+        spaces = ' ' * ((cols - len(text))/2)
+        out_streams.write(' ' + spaces + text)
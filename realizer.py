@@ -6,15 +6,49 @@ __license__ = 'ISC'
 __version__ = '0.5.0.0'
 __status__ = 'Development'
 
+import inspect
 import re
 import types
 import irregular_verb
+import tracing
+
+# Conjugated verbs, from (verb, person, number, tense_er, tense_rs,
+# progressive, negated, intensive, future_style) to the words of the verb.
+# These depend on nothing else, so all sessions share them.
+CONJUGATIONS = {}
+
+# Parsed templates, from each template string to its parts. The templates
+# are mostly fixed strings from the fiction and the discourse model, but
+# some are made anew, so the cache is emptied if it grows past the limit.
+TEMPLATES = {}
+TEMPLATE_LIMIT = 10000
+
+def takes_chance(output_filter):
+    'Returns False if the filter takes only the string, True otherwise.'
+    function = output_filter
+    if not inspect.isfunction(function) and not inspect.ismethod(function):
+        function = getattr(function, '__call__', None)
+    if inspect.ismethod(function):
+        (function, bound) = (function.im_func, function.im_self is not None)
+    elif inspect.isfunction(function):
+        bound = False
+    else:
+        return True
+    (args, varargs, _, _) = inspect.getargspec(function)
+    return varargs is not None or len(args) - int(bound) > 1
+
+def apply_filter_list(filter_list, string, chance):
+    """Transforms the string by applying all filters in the list.
 
-def apply_filter_list(filter_list, string):
-    'Transforms the string by applying all filters in the list.'
+    Each filter is also given chance, the session's random number generator,
+    for anything it leaves to chance. Filters written to take only the string
+    are given only that."""
     if filter_list is not None:
         for output_filter in filter_list:
-            string = output_filter(string)
+            if takes_chance(output_filter):
+                string = output_filter(string, chance)
+            else:
+                string = output_filter(string)
     return string
 
 
@@ -30,6 +64,7 @@ class Section(object):
             string += str(i) + '\n'
         return string + '</section>\n'
 
+    @tracing.traced('Section.realize')
     def realize(self, concept, discourse):
         'Return a string realized from this, the concept, and the discourse.'
         string = ''
@@ -59,10 +94,10 @@ class Heading(object):
 class Paragraph(object):
     'Unit of several sentences, realized with indentation and spacing.'
 
-    def __init__(self, template_filter, strings, time=0):
+    def __init__(self, template_filter, strings, time=0, chance=None):
         self.sentences = []
         for i in strings:
-            self.sentences.append(Sentence(template_filter, i, time))
+            self.sentences.append(Sentence(template_filter, i, time, chance))
 
     def __eq__(self, pgraph):
         return self.sentences == pgraph.sentences
@@ -98,7 +133,8 @@ class Paragraph(object):
                     capitalize = False
                 else:
                     capitalize = True
-        string = apply_filter_list(discourse.spin['paragraph_filter'], string)
+        string = apply_filter_list(discourse.spin['paragraph_filter'], string,
+                                   discourse.random)
         string = string.strip()
         return discourse.typo.format_paragraph(string, previous, last)
 
@@ -117,60 +153,21 @@ class GeneratorSettings(object):
 class Sentence(object):
     'Holds a template with slots and other necessary parameters.'
 
-    def __init__(self, t_filter, string, time):
-        string = re.sub(']', '] ', string)
-        string = apply_filter_list(t_filter, string)
+    def __init__(self, t_filter, string, time, chance=None):
+        if t_filter is None:
+            template = compile_template(string)
+        else:
+            # Filters may change a template differently each time.
+            string = apply_filter_list(t_filter, re.sub(']', '] ', string),
+                                       chance)
+            template = parse_template(string)
         self.parts = []
         self.settings = None
-        for token in string.split():
-            noun_kws = {}
-            if token[0] == '[' and token[-1] == ']':
-                slot = token[1:-1].lower()
-                if slot[-2:] == "'s":
-                    self.parts.append(Pronoun(slot[:-2], Pronoun.possessive,
-                                      time))
-                else:
-                    bits = slot.split('/') # A slot has different bits.
-                    if 'pro' in bits:
-                        noun_kws['pronominalize'] = True
-                        bits.remove('pro')
-                    kind = bits.pop()
-                    if kind in ['here', 'now', 'this', 'these']:
-                        self.parts.append(Deictic(kind))
-                    elif kind in ['begin-caps', 'end-caps']:
-                        self.parts.append(token)
-                    else:
-                        head = bits.pop(0)
-                        if kind == 's':
-                            self.parts.append(Noun(head, Noun.subject, bits,
-                                                   time, **noun_kws))
-                        elif kind == 'o':
-                            self.parts.append(Noun(head, Noun.object, bits,
-                                                   time, **noun_kws))
-                        elif kind == 'a':
-                            self.parts.append(Adjective(bits[-1], head, time))
-                        elif kind == 'v':
-                            verb_kws = {}
-                            verb_kws['negated'] = False
-                            if 'do' in bits:
-                                verb_kws['intensive'] = True
-                            if 'not' in bits:
-                                verb_kws['negated'] = True
-                            if '1' in bits:
-                                verb_kws['default_number'] = 'singular'
-                            elif '2' in bits:
-                                verb_kws['default_number'] = 'plural'
-                            if 'ing' in bits:
-                                verb_kws['progressive'] = True
-                            if 'ed' in bits:
-                                verb_kws['tense_er'] = 'anterior'
-                            self.parts.append(Verb(head, time, **verb_kws))
-            elif '_' in token:
-                self.parts.append(NP(token))
-            else:
-                if token[:2] == '\\[':
-                    token = token[1:]
-                self.parts.append(token)
+        for part in template:
+            if type(part) is types.TupleType:
+                (word_class, args, keywords) = part
+                part = word_class(*(args + (time,)), **keywords)
+            self.parts.append(part)
 
     def __eq__(self, sentence):
         return self.parts == sentence.parts
@@ -216,13 +213,81 @@ class Sentence(object):
                 if all_caps:
                     more = more.upper()
                 phrases.append(more)
-        phrases = apply_filter_list(discourse.spin['sentence_filter'], phrases)
+        phrases = apply_filter_list(discourse.spin['sentence_filter'], phrases,
+                                    discourse.random)
         string = ' '.join(phrases)
         string = re.sub('\( ', '(', string)
         string = re.sub(' \)', ')', string)
         return string.strip()
  
 
+def compile_template(string):
+    """Return the parts of a template, parsing it only the first time.
+
+    Parts are shared by every Sentence made from the template, so they are
+    either strings, Words that do not change when realized, or tuples that
+    give the class and arguments (all but the time) of a new Word."""
+    if string not in TEMPLATES:
+        if len(TEMPLATES) >= TEMPLATE_LIMIT:
+            TEMPLATES.clear()
+        TEMPLATES[string] = parse_template(re.sub(']', '] ', string))
+    return TEMPLATES[string]
+
+
+def parse_template(string):
+    'Return the parts of a template in which each slot is followed by a space.'
+    parts = []
+    for token in string.split():
+        noun_kws = {}
+        if token[0] == '[' and token[-1] == ']':
+            slot = token[1:-1].lower()
+            if slot[-2:] == "'s":
+                parts.append((Pronoun, (slot[:-2], Pronoun.possessive), {}))
+            else:
+                bits = slot.split('/') # A slot has different bits.
+                if 'pro' in bits:
+                    noun_kws['pronominalize'] = True
+                    bits.remove('pro')
+                kind = bits.pop()
+                if kind in ['here', 'now', 'this', 'these']:
+                    parts.append(Deictic(kind))
+                elif kind in ['begin-caps', 'end-caps']:
+                    parts.append(token)
+                else:
+                    head = bits.pop(0)
+                    if kind == 's':
+                        parts.append((Noun, (head, Noun.subject, tuple(bits)),
+                                      noun_kws))
+                    elif kind == 'o':
+                        parts.append((Noun, (head, Noun.object, tuple(bits)),
+                                      noun_kws))
+                    elif kind == 'a':
+                        parts.append((Adjective, (bits[-1], head), {}))
+                    elif kind == 'v':
+                        verb_kws = {}
+                        verb_kws['negated'] = False
+                        if 'do' in bits:
+                            verb_kws['intensive'] = True
+                        if 'not' in bits:
+                            verb_kws['negated'] = True
+                        if '1' in bits:
+                            verb_kws['default_number'] = 'singular'
+                        elif '2' in bits:
+                            verb_kws['default_number'] = 'plural'
+                        if 'ing' in bits:
+                            verb_kws['progressive'] = True
+                        if 'ed' in bits:
+                            verb_kws['tense_er'] = 'anterior'
+                        parts.append((Verb, (head,), verb_kws))
+        elif '_' in token:
+            parts.append(NP(token))
+        else:
+            if token[:2] == '\\[':
+                token = token[1:]
+            parts.append(token)
+    return tuple(parts)
+
+
 def fix_orthography(string, capitalize=True):
     'Capitalize (optionally) and punctuate the end of a sentence string.'
 
@@ -812,33 +877,41 @@ class Verb(Word):
                     helper_words += 'have '
         return main_word, helper_words
 
-    def realize(self, concept, _, settings, subjects, tf):
-        'Return a string realized from the word.'
-        person = self.determine_person(concept, settings, subjects)
-        number = self.determine_number(concept, settings, subjects)
-        progressive = self.determine_progressive(settings)
-        if hasattr(self, 'tense_er'):
-            settings.tense_er = self.tense_er
-
+    def conjugate(self, person, number, r_s, e_r, progressive):
+        'Return the words of the verb, helpers first, in this form.'
         main_word, helper_words = self.determine_main_word(person, number,
-                                  settings.tense_rs, settings.tense_er,
-                                  progressive)
+                                  r_s, e_r, progressive)
         if self.intensive or self.negated:
             main_word, helper_words = self.apply_intensive(main_word,
                                       helper_words, person, number, 
-                                      settings.tense_rs, settings.tense_er,
-                                      progressive)
+                                      r_s, e_r, progressive)
         if self.negated:
             main_word, helper_words = negate(main_word, helper_words)
-        if settings.tense_rs == 'future':
+        if r_s == 'future':
             main_word, helper_words = self.apply_future_style(main_word,
                                       helper_words, person, number,
-                                      settings.tense_er, progressive)
+                                      e_r, progressive)
 
-        if settings.tense_er == 'posterior' and settings.tense_rs == 'future':
+        if e_r == 'posterior' and r_s == 'future':
             helper_words += 'be about to '
 
-        all_words = helper_words + main_word
+        return helper_words + main_word
+
+    def realize(self, concept, _, settings, subjects, tf):
+        'Return a string realized from the word.'
+        person = self.determine_person(concept, settings, subjects)
+        number = self.determine_number(concept, settings, subjects)
+        progressive = self.determine_progressive(settings)
+        if hasattr(self, 'tense_er'):
+            settings.tense_er = self.tense_er
+
+        key = (self.tag, person, number, settings.tense_er, settings.tense_rs,
+               progressive, self.negated, self.intensive, self.future_style)
+        if key not in CONJUGATIONS:
+            CONJUGATIONS[key] = self.conjugate(person, number,
+                                               settings.tense_rs,
+                                               settings.tense_er, progressive)
+        all_words = CONJUGATIONS[key]
 
         tf = True
         return (all_words, subjects, tf)
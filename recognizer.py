@@ -8,27 +8,46 @@ __status__ = 'Development'
 
 import copy
 import re
+import sre_constants
+import sre_parse
 
-def noun_phrase(item, discourse):
-    'Returns a regular expression (string) corresponding to the Item.'
-    (before, nouns, after) = item.referring
+import discourse_model
+import tracing
+
+def person_nouns(item, discourse):
+    'Returns the nouns, such as "me," that refer to the Item in this spin.'
+    nouns = set()
     if str(item) == discourse.spin['narratee']:
         nouns.update(discourse.me_nouns)
     if str(item) == discourse.spin['narrator']:
         nouns.update(discourse.you_nouns)
+    return nouns
+
+def noun_phrase(item, discourse):
+    'Returns a regular expression (string) corresponding to the Item.'
+    (before, nouns, after) = item.referring
+    extra = person_nouns(item, discourse)
+    if len(extra) > 0:
+        # The Item itself is left as it is, so that it still equals the
+        # World's version of it and the Concept need not be updated.
+        nouns = nouns | extra
     phrase = ('((and|,|' + '|'.join(before) + '|' + '|'.join(nouns) + ') )*' +
               '(' + '|'.join(nouns) + ')' +
               '( (' + '|'.join(after) + '|' + '|'.join(nouns) + '))*')
     return discourse.determiner + phrase
 
-def correspond(exp, string):
-    'Returns True if and only if the expression matches the entire string.'
+def anchored(exp):
+    'Returns the expression so that it can only match an entire string.'
     if len(exp) > 0:
         if not exp[0] == '^':
             exp = '^' + exp
         if not exp[-1] == '$':
             exp = exp + '$'
-    return re.match(exp, string)
+    return exp
+
+def correspond(exp, string):
+    'Returns True if and only if the expression matches the entire string.'
+    return re.match(anchored(exp), string)
 
 def contained_substances(items, concept):
     contents = []
@@ -89,6 +108,119 @@ def nonterminal(nonterm, discourse, concept):
                 phrases.append((noun_phrase(concept.item[i], discourse), i))
     return phrases
 
+# Compiled noun phrase expressions, from each expression to its pattern.
+# All sessions share them, and the expressions change as Items do, so the
+# cache is emptied if it grows past the limit.
+COMPILED = {}
+COMPILED_LIMIT = 10000
+
+def compiled(exp):
+    'Returns the compiled expression, compiling each distinct one only once.'
+    if exp not in COMPILED:
+        if len(COMPILED) >= COMPILED_LIMIT:
+            COMPILED.clear()
+        COMPILED[exp] = re.compile(exp)
+    return COMPILED[exp]
+
+def determiner_words(determiner):
+    'Returns the words the determiner expression matches, or None if unknown.'
+    try:
+        strings = discourse_model.expand_expression(sre_parse.parse(determiner))
+    except sre_constants.error:
+        return None
+    if strings is None:
+        return None
+    return set([i.split()[0] for i in strings if len(i.split()) > 0])
+
+def word_prefixes(token):
+    """Returns the token and its prefixes that end at a word boundary.
+
+    A name in a noun phrase expression can match such a prefix, since the
+    expression only requires a word boundary after the name."""
+    prefixes = [token]
+    position = 0
+    for run in re.findall('\\w+|\\W+', token)[:-1]:
+        position += len(run)
+        prefixes.append(token[:position])
+    return prefixes
+
+class PhraseIndex(object):
+    """Noun phrase patterns for nonterminals, indexed by their first words.
+
+    The indexes are kept in the Concept across turns, so the phrases for each
+    nonterminal are produced again only after the Concept's Items change (or
+    the spin does), not for every input and every rule that uses them. Each
+    phrase is also indexed by the words that can begin it: an Item's
+    referring words, "and," and the comma. Only phrases that can begin with
+    the first token (or the token after a determiner) have their patterns
+    checked, so resolving a phrase doesn't require trying every Item.
+    Patterns are compiled once per distinct expression."""
+
+    def __init__(self, discourse, concept):
+        self.discourse = discourse
+        self.concept = concept
+        self.determiners = determiner_words(discourse.determiner)
+        # WorldOrConcept.items_changed() replaces this when the Items change.
+        self._index = concept._phrases
+
+    def first_words(self, nonterm, exp, arg):
+        'Returns the words that can begin the phrase, or None if unknown.'
+        if nonterm in ['DIRECTION', 'RELATION']:
+            return discourse_model.leading_words(exp)
+        (before, nouns, _) = self.concept.item[arg].referring
+        if type(nouns) is not set:
+            # There is no way to refer to this Item; its expression is empty
+            # and can match anywhere.
+            return None
+        words = (set(['and', ',']) | before | nouns |
+                 person_nouns(self.concept.item[arg], self.discourse))
+        for word in words:
+            if len(word) == 0 or re.search('[][\\\\.^$*+?{}|()]', word):
+                return None
+        return words
+
+    def index(self, nonterm):
+        'Returns the entries, the word index, and entries indexed under none.'
+        spin = self.discourse.spin
+        key = (spin['commanded'], spin['narrator'], spin['narratee'],
+               self.discourse.determiner, nonterm)
+        if key not in self._index:
+            entries = []
+            lexicon = {}
+            anywhere = []
+            for (exp, arg) in nonterminal(nonterm, self.discourse,
+                                          self.concept):
+                words = self.first_words(nonterm, exp, arg)
+                if len(exp) > 0 and not exp[-1] == ' ':
+                    exp += '(\\b|$)'
+                if words is None:
+                    anywhere.append(len(entries))
+                else:
+                    for word in words:
+                        lexicon.setdefault(word, []).append(len(entries))
+                entries.append((exp, arg))
+            self._index[key] = (entries, lexicon, anywhere)
+        return self._index[key]
+
+    def patterns(self, nonterm, token_string=None):
+        """Returns (compiled pattern, tag) pairs for the nonterminal.
+
+        If the token string is given, only the pairs with patterns that might
+        match it are returned, in the same order."""
+        (entries, lexicon, anywhere) = self.index(nonterm)
+        if token_string is None or self.determiners is None:
+            positions = range(len(entries))
+        else:
+            tokens = token_string.split(' ', 2)
+            keys = word_prefixes(tokens[0])
+            if len(tokens) > 1 and tokens[0] in self.determiners:
+                keys += word_prefixes(tokens[1])
+            positions = set(anywhere)
+            for word in keys:
+                positions.update(lexicon.get(word, []))
+            positions = sorted(positions)
+        return [(compiled(entries[i][0]), entries[i][1]) for i in positions]
+
 def agent_access(agent, concept):
     """Returns a list of everything the agent can access.
 
@@ -117,7 +249,8 @@ def worn(agent, concept):
             items.append(item)
     return items
 
-def check_rule(rule_list, action_list, token_string, discourse, concept):
+def check_rule(rule_list, action_list, token_string, discourse, concept,
+               phrases=None):
     """Returns all rules on the rule list that match the token string.
 
     For instance, the two tokens "take lamp" will match ['TAKE', '@lamp'],
@@ -127,19 +260,26 @@ def check_rule(rule_list, action_list, token_string, discourse, concept):
     returned.
 
     In cases of ambiguity ("take a thing" when there are several around) a
-    single call of check_rule() may return a list with several Items."""
+    single call of check_rule() may return a list with several Items.
+
+    The phrases argument, a PhraseIndex, can be shared between calls made
+    while recognizing the same input."""
+    if phrases is None:
+        phrases = PhraseIndex(discourse, concept)
     verb_part = rule_list[0]
     command_verb = action_list[0]
     result = []
+    grammar = discourse.grammar
     if len(rule_list) == 1:
-        if correspond(verb_part, token_string):
+        if grammar.pattern(anchored(verb_part)).match(token_string):
             result = [[command_verb]]
-    elif re.match(verb_part, token_string) is not None:
-        token_string = re.sub('^' + verb_part + ' ', '', token_string)
+    elif grammar.pattern(verb_part).match(token_string) is not None:
+        token_string = grammar.pattern('^' + verb_part + ' ').sub('',
+                                                                  token_string)
         r_list = copy.copy(rule_list)
         a_list = copy.copy(action_list)
         args = check_args((r_list, 1), (a_list, 1), token_string,
-                          discourse, concept)
+                          discourse, concept, phrases)
         if len(args) == 1:
             if args[0].pop() == '-SUCCESS-':
                 result = [[command_verb] + args[0]]
@@ -150,8 +290,10 @@ def check_rule(rule_list, action_list, token_string, discourse, concept):
                 result.append([command_verb] + i)
     return result
 
-def check_args(rule, action, token_string, discourse, concept):
+def check_args(rule, action, token_string, discourse, concept, phrases=None):
     'Returns matches for tokens past the first one, the arguments.'
+    if phrases is None:
+        phrases = PhraseIndex(discourse, concept)
     (rule_list, rule_index) = rule
     (action_list, action_index) = action
     matched = []
@@ -174,37 +316,42 @@ def check_args(rule, action, token_string, discourse, concept):
         if not rule_piece[0].isupper():
             if not rule_piece[-1] == ' ':
                 rule_piece += '(\\b|$)'
-            if re.match(rule_piece, token_string) is not None:
-                token_string = re.sub('^' + rule_piece, '', token_string)
+            piece_match = discourse.grammar.pattern(rule_piece).match(
+                                                               token_string)
+            if piece_match is not None:
+                token_string = token_string[piece_match.end():]
                 if token_string[:1] == ' ':
                     token_string = token_string[1:]
                 matched = check_args((rule_list, rule_index+1),
                                      (action_list, action_index),
-                                     token_string, discourse, concept)
+                                     token_string, discourse, concept,
+                                     phrases)
         elif rule_piece == 'STRING':
             word = re.sub(' .*', '', token_string)
             token_string = re.sub('^'+word+' ?', '', token_string)
             additional = check_args((rule_list, rule_index+1),
                                     (action_list, action_index),
-                                    token_string, discourse, concept)
+                                    token_string, discourse, concept,
+                                    phrases)
             for i in additional:
                 matched.append([word] + i)
         else:
-            for (exp, arg) in nonterminal(rule_piece, discourse, concept):
-                if len(exp) > 0 and not exp[-1] == ' ':
-                    exp += '(\\b|$)'
-                if re.match(exp, token_string) is not None:
-                    new_token_string = re.sub('^' + exp, '', token_string)
+            for (pattern, arg) in phrases.patterns(rule_piece,
+                                                   token_string):
+                phrase_match = pattern.match(token_string)
+                if phrase_match is not None:
+                    new_token_string = token_string[phrase_match.end():]
                     if new_token_string[:1] == ' ':
                         new_token_string = new_token_string[1:]
                     additional = check_args((rule_list, rule_index+1),
                                             (action_list, action_index+1),
                                             new_token_string, discourse,
-                                            concept)
+                                            concept, phrases)
                     for i in additional:
                         matched.append([arg] + i)
     return matched
 
+@tracing.traced('recognizer.recognize')
 def recognize(user_input, discourse, concept):
     """Main function for parsing user input.
 
@@ -228,9 +375,10 @@ def recognize(user_input, discourse, concept):
 
     rule_matches = []
     token_string = ' '.join(first)
-    for (action_list, rule_list) in discourse.commands:
+    phrases = PhraseIndex(discourse, concept)
+    for (action_list, rule_list) in discourse.grammar.candidates(first[0]):
         for new_match in check_rule(rule_list, action_list, token_string,
-                                    discourse, concept):
+                                    discourse, concept, phrases):
             if not new_match in rule_matches:
                 rule_matches.append(new_match)
 
@@ -7,7 +7,8 @@ __version__ = '0.5.0.0'
 __status__ = 'Development'
 
 import operator
-import random
+
+import tracing
 
 def determine_speed(action, discourse):
     'Returns a number in [0, 1], the speed of narration for this Action.'
@@ -100,6 +101,7 @@ def determine_speech_time(discourse):
     return speech_time
 
 
+@tracing.traced('reply_planner.plan')
 def plan(action_ids, concept, discourse):
     'Create a reply structure based on indicated Actions and the spin.'
 
@@ -149,7 +151,7 @@ def plan(action_ids, concept, discourse):
         reply_plan = structure_nodes(nodes, reference_time, speech_time,
                                      discourse)
     elif discourse.spin['order'] == 'achrony':
-        random.shuffle(actions)
+        discourse.random.shuffle(actions)
         nodes = [TellAction(i) for i in actions]
         reply_plan = structure_nodes(nodes, reference_time, speech_time,
                                      discourse)
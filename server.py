@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+'Host many independent sessions of Curveship in a single process.'
+
+__author__ = 'Nick Montfort'
+__copyright__ = 'Copyright 2011 Nick Montfort'
+__license__ = 'ISC'
+__version__ = '0.5.0.0'
+__status__ = 'Development'
+
+import asynchat
+import asyncore
+import glob
+import itertools
+import json
+import optparse
+import os
+import socket
+import StringIO
+import sys
+
+import action_model
+import clarifier
+import curveship
+import joker
+import journal
+import preparer
+import presenter
+import recognizer
+import tracing
+
+class Session(object):
+    """One player's session: a World and Discourse and everything else that
+    would otherwise be shared with the other sessions in the process.
+
+    Each session loads its own copy of the fiction and spin modules, keeps its
+    own command mappings, and numbers its own Actions, starting from 1. What
+    is left to chance is drawn from the session's own random number
+    generator, which its World and Discourse keep. While tracing is on, the
+    session's calls and copies are counted in its own "counts" dictionary."""
+
+    def __init__(self, if_file, spin_files, width=80, debug=True, seed=None):
+        self.if_file = if_file
+        self.spin_files = spin_files
+        self.width = width
+        self.debug = debug
+        self.seed = seed
+        self.commands = curveship.Commands()
+        # The session's own fiction and spin modules, which are used by its
+        # Items and spin for as long as the session lasts.
+        self.modules = {}
+        self.action_ids = action_model.generator(1)
+        self.other_ids = None
+        self.counts = {}
+        self.other_counts = None
+        self.world = None
+        self.discourse = None
+        # An ambiguous input, if the session is waiting to be told which
+        # command was meant.
+        self.pending = None
+
+    def enter(self):
+        'Have new Actions numbered, and tracing counted, by this session.'
+        self.other_ids = action_model.ACTION_ID
+        action_model.ACTION_ID = self.action_ids
+        self.other_counts = tracing.COUNTS
+        tracing.COUNTS = self.counts
+
+    def leave(self):
+        'Have Actions numbered and counted as they were before entering.'
+        # A session that has been restored numbers its Actions anew.
+        self.action_ids = action_model.ACTION_ID
+        action_model.ACTION_ID = self.other_ids
+        self.other_ids = None
+        tracing.COUNTS = self.other_counts
+        self.other_counts = None
+
+    def running(self):
+        'Is the session still going on?'
+        return self.world is not None and self.world.running
+
+    def asking(self):
+        'Is the session waiting to be told which command was meant?'
+        return self.pending is not None
+
+    def prompt(self):
+        'Return the prompt for the next input, if one is needed.'
+        if self.asking() or self.discourse.spin['commanded'] is None:
+            # The question about which command was meant ends in a prompt.
+            return ''
+        return self.discourse.typo.prompt
+
+    def start(self):
+        'Load the fiction and spin files and return the opening text.'
+        transcript = StringIO.StringIO()
+        out_streams = curveship.Multistream([transcript], width=self.width)
+        self.enter()
+        try:
+            world, discourse = curveship.initialize(self.if_file,
+                                                    list(self.spin_files),
+                                                    out_streams,
+                                                    self.commands,
+                                                    self.modules, self.seed)
+            discourse.debug = self.debug
+            self.world, self.discourse = curveship.run_initial_actions(world,
+                                         discourse, out_streams, self.commands)
+            in_stream = curveship.InputList([])
+            while (self.world.running and
+                   hasattr(self.discourse, 'initial_inputs') and
+                   len(self.discourse.initial_inputs) > 0):
+                self.world, self.discourse = curveship.each_turn(self.world,
+                                             self.discourse, in_stream,
+                                             out_streams, False, self.commands,
+                                             self.modules)
+        finally:
+            self.leave()
+        return transcript.getvalue()
+
+    def recover(self, record):
+        """Recover the session from the record in its journal.
+
+        Each line is played again as it was before, so that if the last one
+        was ambiguous, the session is again waiting to be told which command
+        was meant."""
+        lines = record['lines']
+        record['lines'] = []
+        self.enter()
+        try:
+            self.world, self.discourse = curveship.rebuild(record,
+                                                           self.commands,
+                                                           self.modules)
+        finally:
+            self.leave()
+        self.discourse.rebuilding = True
+        for line in lines:
+            self.play(text(line))
+        del self.discourse.rebuilding
+
+    def play(self, input_string):
+        """Take one input and return the reply to it.
+
+        If the input is ambiguous, the reply asks which command was meant and
+        the next input is taken as the answer. In a session that does not
+        take commands, any input advances it by one turn."""
+        transcript = StringIO.StringIO()
+        out_streams = curveship.Multistream([transcript], width=self.width)
+        self.enter()
+        try:
+            if self.discourse.spin['commanded'] is None:
+                self.world, self.discourse = curveship.each_turn(self.world,
+                                             self.discourse,
+                                             curveship.InputList([]),
+                                             out_streams, False, self.commands,
+                                             self.modules)
+            else:
+                user_input = preparer.tokenize(input_string,
+                                               self.discourse.separator)
+                self.discourse.input_list.add_line(user_input.string)
+                if self.pending is not None:
+                    user_input = self.answer(user_input, out_streams)
+                self.handle(user_input, out_streams)
+        finally:
+            self.leave()
+        return transcript.getvalue()
+
+    def answer(self, choose_a_number, out_streams):
+        'Take the answer to a question and carry out the command chosen.'
+        user_input = self.pending
+        self.pending = None
+        presenter.present(clarifier.choose(user_input, choose_a_number,
+                                           self.discourse), out_streams)
+        self.respond(user_input, out_streams)
+        return user_input
+
+    def handle(self, user_input, out_streams):
+        'Deal with each command in the input, stopping to ask if need be.'
+        while len(user_input.tokens) > 0 and self.world.running:
+            concept = self.world.concept[self.discourse.spin['commanded']]
+            user_input = recognizer.recognize(user_input, self.discourse,
+                                              concept)
+            if user_input.unrecognized and clarifier.is_ambiguous(user_input):
+                presenter.present(clarifier.question(user_input, concept,
+                                                     self.discourse),
+                                  out_streams)
+                out_streams.write(clarifier.prompt(user_input))
+                self.pending = user_input
+                return
+            if user_input.unrecognized:
+                user_input = clarifier.clarify(user_input, concept,
+                                               self.discourse, None,
+                                               out_streams)
+            self.respond(user_input, out_streams)
+
+    def respond(self, user_input, out_streams):
+        'Carry out a recognized command or directive.'
+        (_, self.world, self.discourse) = curveship.respond(user_input,
+                                          self.world, self.discourse,
+                                          out_streams, self.commands,
+                                          self.modules)
+
+
+class SessionHost(object):
+    """Keeps sessions, each under its own number, and answers requests.
+
+    A request is a dictionary with an "op" of "start," "input," or "end."
+    To start a session, give the "fiction" file and, optionally, a list of
+    "spins," a "width" for the output, "debug" as false to disable
+    debugging directives, and a "seed" for the random number generator. To
+    play, give the "session" number and the "input." Each response has the
+    "session" number, the "output," and whether the session is "running" and
+    whether it is "asking" which command was meant. A session that has
+    stopped running is ended. If a request has an "id," it is included in
+    the response; if a request fails, the response has an "error" instead of
+    output.
+
+    If a directory for journals is given, each session is journaled there
+    as it is played, and sessions that were journaled but not ended, for
+    instance because the server stopped, are recovered when it starts."""
+
+    def __init__(self, width=80, debug=True, journals=None):
+        self.width = width
+        self.debug = debug
+        self.sessions = {}
+        self.journals = journals
+        self.session_journals = {}
+        latest = 0
+        if self.journals is not None:
+            latest = self.recover()
+        self.session_ids = itertools.count(latest + 1)
+
+    def journal_name(self, number):
+        'Return the name of the journal file for a session.'
+        return os.path.join(self.journals, str(number) + '.journal')
+
+    def recover(self):
+        """Recover the journaled sessions that were not ended.
+
+        Only journals named with a session number are recovered. Returns the
+        highest session number that has been used."""
+        latest = 0
+        for file_name in glob.glob(os.path.join(self.journals, '*.journal')):
+            name = os.path.basename(file_name).split('.')[0]
+            if not name.isdigit():
+                # Not the journal of a session numbered by the server.
+                continue
+            number = int(name)
+            latest = max(latest, number)
+            record = journal.read_journal(file_name)
+            if record is not None:
+                session = Session(str(record['fiction']),
+                                  [str(s) for s in record['spins']],
+                                  self.width, record['debug'],
+                                  record.get('seed'))
+                session.recover(record)
+                self.sessions[number] = session
+                self.session_journals[number] = journal.Journal(file_name)
+                self.session_journals[number].continue_from(session.discourse)
+        return latest
+
+    def handle(self, request):
+        'Carry out a request and return the response.'
+        response = {}
+        if 'id' in request:
+            response['id'] = request['id']
+        try:
+            op = request.get('op')
+            if op == 'start':
+                (number, output) = self.start(request)
+            elif op in ['input', 'end']:
+                number = request.get('session')
+                if number not in self.sessions:
+                    raise StandardError('There is no session ' +
+                                        str(number) + '.')
+                output = ''
+                if op == 'input':
+                    output = self.sessions[number].play(
+                             text(request.get('input', '')))
+                else:
+                    self.sessions[number].world.running = False
+            else:
+                raise StandardError('The "op" of a request must be "start,"' +
+                                    ' "input," or "end."')
+        except Exception, err:
+            response['error'] = error_message(err)
+            return response
+        session = self.sessions[number]
+        response.update({'session': number, 'output': output,
+                         'running': session.running(),
+                         'asking': session.asking()})
+        if number in self.session_journals:
+            if session.running():
+                self.session_journals[number].update(session.world,
+                                                     session.discourse)
+            else:
+                self.session_journals.pop(number).end()
+        if not session.running():
+            del self.sessions[number]
+        return response
+
+    def start(self, request):
+        'Start a new session and return its number and opening text.'
+        if 'fiction' not in request:
+            raise StandardError('A "fiction" file is needed to start a ' +
+                                'session.')
+        session = Session(text(request['fiction']),
+                          [text(s) for s in request.get('spins', [])],
+                          request.get('width', self.width),
+                          request.get('debug', self.debug),
+                          request.get('seed'))
+        output = session.start()
+        number = self.session_ids.next()
+        self.sessions[number] = session
+        if self.journals is not None:
+            self.session_journals[number] = journal.Journal(
+                                            self.journal_name(number))
+        return (number, output)
+
+
+def error_message(err):
+    'Return a message explaining an error to a client or player.'
+    if isinstance(err, joker.StartupError):
+        return err.msg
+    return err.__class__.__name__ + ': ' + str(err)
+
+
+def text(string):
+    'Return a string from a request as a byte string for Curveship.'
+    if isinstance(string, unicode):
+        return string.encode('utf-8')
+    return str(string)
+
+
+def serve(host, in_stream=sys.stdin, out_stream=sys.stdout):
+    """Answer requests, one JSON object per line, until the input ends.
+
+    Each response is written as one line of JSON."""
+    while True:
+        line = in_stream.readline()
+        if line == '':
+            break
+        if line.strip() == '':
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request must be a JSON object')
+            response = host.handle(request)
+        except ValueError, err:
+            response = {'error': 'Bad request: ' + str(err)}
+        out_stream.write(json.dumps(response) + '\n')
+        out_stream.flush()
+
+
+class PlayerChannel(asynchat.async_chat):
+    """A connection to one player, who plays a session of their own.
+
+    Each line the player sends is an input. Nothing waits for the player:
+    the session is played a turn at a time as lines arrive, and a question
+    about which command was meant is answered by the next line.
+
+    If the session fails, the player is told why and only this player's
+    connection is closed."""
+
+    def __init__(self, sock, session):
+        asynchat.async_chat.__init__(self, sock)
+        self.set_terminator('\n')
+        self.data = []
+        self.session = session
+        try:
+            output = self.session.start()
+        except Exception, err:
+            self.fail(err)
+            return
+        self.reply(output)
+
+    def collect_incoming_data(self, data):
+        'Keep the part of the line that has arrived so far.'
+        self.data.append(data)
+
+    def found_terminator(self):
+        'Play the line that has arrived as the next input.'
+        input_string = ''.join(self.data).rstrip('\r')
+        self.data = []
+        if self.session.running():
+            try:
+                output = self.session.play(input_string)
+            except Exception, err:
+                self.fail(err)
+                return
+            self.reply('\n' + output)
+
+    def reply(self, output):
+        'Send the output, then a prompt or, if the session is over, nothing.'
+        if self.session.running():
+            self.push(output + self.session.prompt())
+        else:
+            self.push(output)
+            self.close_when_done()
+
+    def fail(self, err):
+        'Tell the player about the error that ended the session, then close.'
+        self.push('\n' + error_message(err) + '\n')
+        self.close_when_done()
+
+
+class PlayerServer(asyncore.dispatcher):
+    """Accepts connections from players on a local port.
+
+    Every player who connects is given a new session of the same fiction,
+    with the same spin files. All of the players are served by one event
+    loop, in one thread. Debugging directives are only enabled for players
+    if debug is True."""
+
+    def __init__(self, port, if_file, spin_files, width=80, debug=False):
+        asyncore.dispatcher.__init__(self)
+        self.if_file = if_file
+        self.spin_files = spin_files
+        self.width = width
+        self.debug = debug
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(('localhost', port))
+        self.listen(5)
+
+    def handle_accept(self):
+        'Start a session for a player who has just connected.'
+        pair = self.accept()
+        if pair is not None:
+            session = Session(self.if_file, self.spin_files, self.width,
+                              self.debug)
+            PlayerChannel(pair[0], session)
+
+    def handle_error(self):
+        'Report an error in accepting a player, and go on listening.'
+        (_, __, err, ___) = asyncore.compact_traceback()
+        sys.stderr.write('Unable to accept a player: ' + error_message(err) +
+                         '\n')
+
+
+def parse_command_line(argv):
+    'Returns the options and, with --port, the fiction and spin files.'
+    parser = optparse.OptionParser(usage='[options] ' +
+                                   '[ --port N fiction.py [ spin.py ... ] ]')
+    parser.add_option('--debug', action='store_true', dest='player_debug',
+                      help='enable debugging directives for players who ' +
+                      'connect with --port', default=False)
+    parser.add_option('--journals', dest='journals', metavar='DIR',
+                      help='journal each session in DIR and recover those ' +
+                      'left there unfinished')
+    parser.add_option('--nodebug', action='store_false', dest='debug',
+                      help='disable debugging directives by default in ' +
+                      'sessions started by requests',
+                      default=True)
+    parser.add_option('--port', dest='port', type='int',
+                      help='serve the fiction to players who connect to ' +
+                      'local port N, rather than answering requests on ' +
+                      'standard input', metavar='N')
+    parser.add_option('--width', dest='width', type='int', default=80,
+                      help='lineate output to N columns by default',
+                      metavar='N')
+    opts, args = parser.parse_args(argv[1:])
+    if opts.port is not None and not args:
+        parser.print_usage()
+        raise joker.StartupError('With --port, at least one argument (the ' +
+                                 'fiction file name) is needed; any other ' +
+                                 'file names are processed in order as ' +
+                                 'spin files.')
+    return opts, args
+
+
+def main(argv, in_stream=sys.stdin, out_stream=sys.stdout):
+    'Host sessions, taking requests from the input stream or from players.'
+    try:
+        opts, args = parse_command_line(argv)
+        if opts.port is None:
+            serve(SessionHost(opts.width, opts.debug, opts.journals),
+                  in_stream, out_stream)
+        else:
+            PlayerServer(opts.port, args[0], args[1:], opts.width,
+                         opts.player_debug)
+            asyncore.loop()
+    except joker.StartupError, err:
+        sys.stderr.write(err.msg + '\n')
+        return 2
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,141 @@
+'Write logs of sessions without making each turn wait for the disk.'
+
+__author__ = 'Nick Montfort'
+__copyright__ = 'Copyright 2011 Nick Montfort'
+__license__ = 'ISC'
+__version__ = '0.5.0.0'
+__status__ = 'Development'
+
+import errno
+import json
+import os
+import Queue
+import threading
+
+# The file, in the directory of logs, that has the number of the latest log.
+LATEST = 'latest'
+
+class LogFile(object):
+    """A log file that keeps what is written until it is flushed.
+
+    It can stand in for a file as one of the streams of a Multistream. Text
+    written to it is only kept in memory. When it is flushed, for instance
+    at the end of a turn, the text is written to the file all at once. If
+    background is True, that is done by a thread of its own, so that the
+    turn does not wait for it."""
+
+    def __init__(self, file_name, background=True):
+        self.name = file_name
+        self.log_file = file(file_name, 'w')
+        self.pending = []
+        self.queue = None
+        self.writer = None
+        if background:
+            self.queue = Queue.Queue()
+            self.writer = threading.Thread(target=self.write_queued)
+            self.writer.daemon = True
+            self.writer.start()
+
+    def write(self, string):
+        'Keep the string to be written when the log is next flushed.'
+        self.pending.append(string)
+
+    def write_record(self, record):
+        'Keep a record (a dictionary) to be written as one line of JSON.'
+        self.pending.append(json.dumps(record) + '\n')
+
+    def flush(self):
+        'Write, or have the thread write, everything kept since last time.'
+        if len(self.pending) == 0:
+            return
+        text = ''.join(self.pending)
+        self.pending = []
+        if self.queue is None:
+            self.log_file.write(text)
+            self.log_file.flush()
+        else:
+            self.queue.put(text)
+
+    def write_queued(self):
+        'In the thread, write each text that is queued until there is None.'
+        text = self.queue.get()
+        while text is not None:
+            self.log_file.write(text)
+            self.log_file.flush()
+            text = self.queue.get()
+
+    def close(self):
+        'Write everything that is left, then close the file.'
+        self.flush()
+        if self.queue is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.queue = None
+        self.log_file.close()
+
+
+def turn_record(turn, lines, inputs, actions, seconds):
+    """Return a record of one turn to be written as a line of JSON.
+
+    It has the lines typed, each input made from them with its category and
+    normal form (and the Action a command caused), the IDs of the Actions
+    done, and the time the turn took."""
+    return {'turn': turn, 'lines': lines,
+            'inputs': [{'string': i.string, 'category': i.category,
+                        'normal': i.normal, 'caused': i.caused}
+                       for i in inputs],
+            'actions': actions, 'seconds': seconds}
+
+
+def new_log_name(directory):
+    """Create the next numbered log file in the directory; return its name.
+
+    The number of the latest log is kept in a file, so the directory is not
+    listed each time. A log file is only created if there is no file by that
+    name, so sessions starting at the same time get different numbers."""
+    number = latest_number(directory) + 1
+    while True:
+        log_file = directory + str(number) + '.log'
+        try:
+            os.close(os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+            break
+        except OSError, err:
+            if not err.errno == errno.EEXIST:
+                raise
+            number += 1
+    temporary = directory + LATEST + '.' + str(os.getpid())
+    latest_file = file(temporary, 'w')
+    latest_file.write(str(number) + '\n')
+    latest_file.close()
+    try:
+        os.rename(temporary, directory + LATEST)
+    except OSError:
+        # Where a file can't be renamed over another, remove that one first.
+        # If another session is doing the same, the number it keeps is used.
+        try:
+            os.remove(directory + LATEST)
+            os.rename(temporary, directory + LATEST)
+        except OSError:
+            os.remove(temporary)
+    return log_file
+
+
+def latest_number(directory):
+    """Return the number of the latest log in the directory, or 0.
+
+    If the number has not been kept, as in a directory of logs written by
+    an earlier version, the directory is listed this once to find it."""
+    try:
+        latest_file = file(directory + LATEST, 'r')
+        try:
+            return int(latest_file.read())
+        finally:
+            latest_file.close()
+    except (IOError, ValueError):
+        pass
+    log_files = [os.path.splitext(l)[0] for l in os.listdir(directory) if
+                 os.path.splitext(l)[1] == '.log']
+    numbers = [int(log_file) for log_file in log_files if log_file.isdigit()]
+    if len(numbers) == 0:
+        return 0
+    return max(numbers)
@@ -1,14 +1,12 @@
-from random import randint, choice
-
 interjections = ['uh', 'uh', 'uh', 'um', 'um', 'er']
 
-def sentence_filter(phrases):
+def sentence_filter(phrases, chance):
     new_phrases = phrases[:1]
     for original in phrases[1:]:
-        if randint(1,6) == 1:
+        if chance.randint(1,6) == 1:
             if not new_phrases[-1][-1] in ',.:;':
                 new_phrases.append(',')
-            new_phrases.append(choice(interjections))
+            new_phrases.append(chance.choice(interjections))
             if not original[:1] in ',.:;':
                 new_phrases.append(',')
         new_phrases.append(original)
@@ -1,19 +1,17 @@
-from random import randint, choice
-
-def sentence_filter(phrases):
+def sentence_filter(phrases, chance):
     new_phrases = phrases[:1]
     for original in phrases[1:]:
-        if randint(1,5) == 1:
+        if chance.randint(1,5) == 1:
             if not new_phrases[-1][-1] in ',.:;':
                 new_phrases.append(',')
             new_phrases.append('like')
             if not original in ',.:;':
                 new_phrases.append(',')
         new_phrases.append(original)
-    if len(new_phrases) > 0 and randint(1,6) == 1:
+    if len(new_phrases) > 0 and chance.randint(1,6) == 1:
         if not new_phrases[-1] in ',.:;':
             new_phrases.append(',')
-        new_phrases.append(choice(['totally', 'for sure']))
+        new_phrases.append(chance.choice(['totally', 'for sure']))
     return new_phrases
 
 spin = {'sentence_filter': [sentence_filter]}
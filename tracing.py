@@ -0,0 +1,81 @@
+"""Hooks for tracing stages of the pipeline and counting what they do.
+
+The hooks and counts are kept for the whole process, which suits timing a
+single session, as the benchmark does. A server.Session has tracing
+counted in a dictionary of its own while it plays; the hooks, though, are
+called for every session, one after another, and cannot tell them apart."""
+
+__author__ = 'Nick Montfort'
+__copyright__ = 'Copyright 2011 Nick Montfort'
+__license__ = 'ISC'
+__version__ = '0.5.0.0'
+__status__ = 'Development'
+
+import time
+
+# The installed hooks. Tracing is on only when there is at least one.
+HOOKS = []
+
+# How many times each traced function was called, or each counted event
+# (such as "deepcopy") happened, while tracing was on. This is replaced by
+# a session's own dictionary while a server.Session plays.
+COUNTS = {}
+
+def add_hook(hook):
+    """Install a hook and so turn tracing on.
+
+    A hook is an object with two methods. start(name) is called as a traced
+    function, such as "World.can_see," begins; end(name, seconds) is called
+    when it returns or raises an exception, with the time it took."""
+    HOOKS.append(hook)
+
+def remove_hook(hook):
+    'Uninstall the hook. If no hooks are left, tracing is off.'
+    HOOKS.remove(hook)
+
+def reset_counts():
+    'Set all the counts back to zero, for instance, at the start of a turn.'
+    COUNTS.clear()
+
+def count(name):
+    'Count one occurrence of the named event, if tracing is on.'
+    if HOOKS:
+        COUNTS[name] = COUNTS.get(name, 0) + 1
+
+def traced(name):
+    """Decorator that calls hooks and counts calls to the function.
+
+    When tracing is off, this adds only a check of the hook list."""
+    def decorate(function):
+        def traced_function(*args, **keywords):
+            if not HOOKS:
+                return function(*args, **keywords)
+            COUNTS[name] = COUNTS.get(name, 0) + 1
+            for hook in HOOKS:
+                hook.start(name)
+            start = time.time()
+            try:
+                return function(*args, **keywords)
+            finally:
+                seconds = time.time() - start
+                for hook in reversed(HOOKS):
+                    hook.end(name, seconds)
+        traced_function.__name__ = function.__name__
+        traced_function.__doc__ = function.__doc__
+        return traced_function
+    return decorate
+
+
+class Timer(object):
+    'A hook that totals the time taken by each traced function.'
+
+    def __init__(self):
+        self.seconds = {}
+
+    def start(self, name):
+        'Nothing is needed when a function starts.'
+        pass
+
+    def end(self, name, seconds):
+        'Add the time taken to the total for this function.'
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
@@ -6,11 +6,19 @@ __license__ = 'ISC'
 __version__ = '0.5.0.0'
 __status__ = 'Development'
 
+import bisect
 import copy
-import operator
+import random
 
 import can
 import item_model
+import tracing
+
+# Features that determine what Actors can access and see. Changing any other
+# feature, such as "locked" or "alive," leaves access and sight as they were.
+REACH_FEATURES = ['accessible', 'children', 'connects', 'door', 'exits',
+                  'glow', 'link', 'open', 'parent', 'prominence', 'room',
+                  'shared', 'transparent', 'view']
 
 def check_for_reserved_tags(items):
     'Raise an error if a reserved tag, such as @cosmos, is in the list.'
@@ -29,6 +37,98 @@ def check_for_reserved_tags(items):
          'Use a different tag for item now tagged "@commanded".')
 
 
+class ItemsAt(dict):
+    """The Items of a Concept at some time, each copied when first used.
+
+    The Items themselves are shared with the Concept they were taken from
+    until they are used, so that they can be changed in a copy of a Concept
+    without changing the original."""
+
+    def __init__(self, items):
+        dict.__init__(self, items)
+        self.copied = set()
+
+    def __getitem__(self, tag):
+        item = dict.__getitem__(self, tag)
+        if tag not in self.copied:
+            item = copy.deepcopy(item)
+            tracing.count('deepcopy')
+            dict.__setitem__(self, tag, item)
+            self.copied.add(tag)
+        return item
+
+    def __setitem__(self, tag, item):
+        dict.__setitem__(self, tag, item)
+        self.copied.discard(tag)
+
+    def __delitem__(self, tag):
+        dict.__delitem__(self, tag)
+        self.copied.discard(tag)
+
+    def get(self, tag, default=None):
+        if tag in self:
+            return self[tag]
+        return default
+
+    def values(self):
+        return [self[tag] for tag in self]
+
+    def items(self):
+        return [(tag, self[tag]) for tag in self]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+
+class ItemsWithChild(object):
+    """The Items of a World or Concept, with one given a proposed new child.
+
+    Only that parent Item is copied. All the others are looked up in the
+    original World or Concept."""
+
+    def __init__(self, items, parent, link, child):
+        self._items = items
+        self.parent = parent
+        self.parent_item = items[parent].with_child(link, child)
+
+    def __getitem__(self, tag):
+        if tag == self.parent:
+            return self.parent_item
+        return self._items[tag]
+
+    def __contains__(self, tag):
+        return tag in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, tag, default=None):
+        if tag in self._items:
+            return self[tag]
+        return default
+
+    def keys(self):
+        return self._items.keys()
+
+    def values(self):
+        return [self[tag] for tag in self._items]
+
+    def items(self):
+        return [(tag, self[tag]) for tag in self._items]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+
 class WorldOrConcept(object):
     'Abstract base class for the World and for Concepts.'
 
@@ -38,7 +138,18 @@ class WorldOrConcept(object):
                                 'class world_model.WorldOrConcept')
         self.item = {}
         self.act = actions
+        self._act_order = None
         self.ticks = 0
+        # Actors in fictions draw anything they leave to chance from this,
+        # which is set to the session's random number generator.
+        self.random = random.Random()
+        # What each Actor can access and see is kept here once found, until
+        # the Items change.
+        self._access = {}
+        self._view = {}
+        self._sight = {}
+        # The noun phrases the recognizer indexes are kept here, too.
+        self._phrases = {}
         seen_tags = []
         # Construct the World's Item dictionary from the Item list:
         for item in item_list:
@@ -53,10 +164,64 @@ class WorldOrConcept(object):
     def __str__(self):
         return str(self.act) + '\n' + str(self.item)
 
+    def items_changed(self, feature=None):
+        """Note that Items have changed, perhaps just one feature of one Item.
+
+        Unless the feature is one that access and sight do not depend on,
+        what Actors can access and see will be found again when needed. The
+        noun phrases that refer to Items are always indexed again."""
+        self._phrases = {}
+        if feature is None or feature in REACH_FEATURES:
+            self._access = {}
+            self._view = {}
+            self._sight = {}
+
+    def add_action(self, action):
+        'Record an Action, keeping track of the order in which Actions start.'
+        if self._act_order is not None:
+            (starts, ids) = self._act_order
+            if action.id in self.act and action.id in ids:
+                # The Action replaces one with its ID, such as an initial
+                # Action that has now been done.
+                old = ids.index(action.id)
+                del starts[old]
+                del ids[old]
+            position = bisect.bisect_right(starts, action.start)
+            starts.insert(position, action.start)
+            ids.insert(position, action.id)
+        self.act[action.id] = action
+
+    def pop_actions(self, time, including=False):
+        """Remove the Actions that start after the time, returning them.
+
+        If "including" is True, also remove those starting at that time.
+        The Action that starts latest is first in the list returned."""
+        if (self._act_order is None or
+            not len(self._act_order[1]) == len(self.act)):
+            # Actions were added directly to the dictionary; order them all.
+            id_times = sorted([(self.act[i].start, i) for i in self.act])
+            self._act_order = ([start for (start, _) in id_times],
+                               [i for (_, i) in id_times])
+        (starts, ids) = self._act_order
+        if including:
+            first = bisect.bisect_left(starts, time)
+        else:
+            first = bisect.bisect_right(starts, time)
+        popped = [self.act.pop(i) for i in reversed(ids[first:])]
+        del starts[first:]
+        del ids[first:]
+        return popped
+
     def accessible(self, actor):
         'List all Items an Item can access.'
         if actor == '@cosmos':
             return self.item.keys()
+        if actor not in self._access:
+            self._access[actor] = self.find_accessible(actor)
+        return list(self._access[actor])
+
+    def find_accessible(self, actor):
+        'Walk the tree to list the Items an Item (not @cosmos) can access.'
         compartment = self.compartment_of(actor)
         tag_list = [str(compartment)]
         for (link, child) in compartment.children:
@@ -71,6 +236,16 @@ class WorldOrConcept(object):
                 accessible_list.append(tag)
         return accessible_list
 
+    def with_child(self, parent, link, tag):
+        """Return this World or Concept as it would be with a new child.
+
+        Nothing is changed here. The new one shares all Items but the parent,
+        so it costs little to make for testing "allowed" rules."""
+        proposed = copy.copy(self)
+        proposed.item = ItemsWithChild(self.item, parent, link, tag)
+        proposed.items_changed()
+        return proposed
+
     def ancestors(self, tag):
         'List all Items hierarchically above an Item.'
         items_above = []
@@ -183,6 +358,9 @@ class Concept(WorldOrConcept):
 
     def __init__(self, item_list, actions, cosmos=None):
         self.changed = []
+        # The change log indexed by tag: the times of each Item's changes,
+        # in order, and the old versions of the Item.
+        self._history = {}
         WorldOrConcept.__init__(self, item_list, actions)
         if cosmos is None:
             cosmos = item_model.Actor('@cosmos', called='nature',
@@ -193,18 +371,27 @@ class Concept(WorldOrConcept):
                 self.item[item.parent].add_child(item.link, tag, True)
 
 
+    def history(self, tag):
+        "Return the times of the Item's changes and the old versions of it."
+        if self._history is None:
+            self._history = {}
+            for (time, changed_tag, old) in self.changed:
+                (times, olds) = self._history.setdefault(changed_tag,
+                                                         ([], []))
+                times.append(time)
+                olds.append(old)
+        return self._history.get(tag, ([], []))
+
     def item_at(self, tag, time):
         'Return the Item from this moment in the Concept.'
         if tag not in self.item:
             return None
-        item = self.item[tag]
-        current = len(self.changed) - 1
-        while current >= 0 and self.changed[current][0] > time:
-            (_, changed_tag, old) = self.changed[current]
-            if changed_tag == tag:
-                item = old
-            current -= 1
-        return item
+        (times, olds) = self.history(tag)
+        # The first change after this moment replaced the Item as it was.
+        after = bisect.bisect_right(times, time)
+        if after < len(times):
+            return olds[after]
+        return self.item[tag]
 
     def update_item(self, item, time):
         'After perception, change an Item within this Concept.'
@@ -214,26 +401,42 @@ class Concept(WorldOrConcept):
             old = None
         self.item[str(item)] = item
         self.changed.append((time, str(item), old))
+        if self._history is not None:
+            (times, olds) = self._history.setdefault(str(item), ([], []))
+            times.append(time)
+            olds.append(old)
+        self.items_changed()
 
     def roll_back_to(self, time):
         'Go back to a previous state of this Concept.'
-        new_ids = []
-        for action_id in self.act:
-            new_ids.append((action_id, self.act[action_id].start))
-        ids_times = sorted(new_ids, key=operator.itemgetter(1))
-        while len(ids_times) > 0 and ids_times[-1][1] > time:
-            (last_id, _) = ids_times.pop()
-            self.act.pop(last_id)
+        self.pop_actions(time)
         while len(self.changed) > 0 and self.changed[-1][0] > time:
             (_, tag, old) = self.changed.pop()
+            if self._history is not None:
+                (times, olds) = self._history[tag]
+                times.pop()
+                olds.pop()
             if old is None:
                 del self.item[tag]
             else:
                 self.item[tag] = old
+        self.items_changed()
 
+    @tracing.traced('Concept.copy_at')
     def copy_at(self, time):
-        'Return a new Concept based on this one, but from an earlier time.'
-        new_concept = copy.deepcopy(self)
+        """Return a new Concept based on this one, but from an earlier time.
+
+        Only the change log after that time is undone. Items are copied only
+        as they are used in the new Concept, so the cost doesn't grow with
+        the number of Items in this one."""
+        new_concept = copy.copy(self)
+        new_concept.item = ItemsAt(self.item)
+        new_concept.act = dict(self.act)
+        if self._act_order is not None:
+            new_concept._act_order = (list(self._act_order[0]),
+                                      list(self._act_order[1]))
+        new_concept.changed = list(self.changed)
+        new_concept._history = None
         new_concept.roll_back_to(time)
         return new_concept
 
@@ -257,6 +460,10 @@ class World(WorldOrConcept):
             action.cause = 'initial_action'
             action_dict[action.id] = action
         self.concept = {}
+        # The Actions in the order they were done. Each starts no earlier
+        # than the one before, so undoing takes them from the end of the list
+        # and costs only as much as the Actions being undone.
+        self.done = []
         WorldOrConcept.__init__(self, fiction.items, action_dict)
         # Instantiate the needed amounts of Substance
         for substance in [i for i in fiction.items if i.substance]:
@@ -331,6 +538,41 @@ class World(WorldOrConcept):
 
     def prevents_sight(self, actor, tag):
         'Returns a reason (if there are any) that "actor" cannot see "tag".'
+        if (actor, tag) not in self._sight:
+            self._sight[(actor, tag)] = self.find_sight_obstacle(actor, tag)
+        return self._sight[(actor, tag)]
+
+    def in_view(self, actor):
+        """Returns the set of tags to which "actor" has a line of sight.
+
+        The Actor must be in play, in some Room or Door."""
+        if actor not in self._view:
+            actor_place = self.room_of(actor)
+            compartment = self.compartment_of(actor)
+            view_tags = []
+            if not compartment == actor_place:
+            # The Actor is is some sort of opaque compartment within a room.
+            # Only Items within that compartment will be visible.
+                view_tags = [str(compartment)]
+                for (link, child) in compartment.children:
+                    if not link == 'on':
+                        view_tags += [child] 
+                        view_tags += self.descendants(child, stop='opaque')
+            else:
+            # Otherwise, list all the Items to which there is a line of sight
+            # in the Actor's Room and in every Room that has a view from there.
+                if self.item[str(actor_place)].door:
+                    rooms_visible = self.item[str(actor_place)].connects
+                else:
+                    rooms_visible = actor_place.view.keys()
+                for room_tag in [str(actor_place)] + rooms_visible:
+                    view_tags += ([room_tag] + 
+                                   self.descendants(room_tag, stop='opaque'))
+            self._view[actor] = set(view_tags)
+        return self._view[actor]
+
+    def find_sight_obstacle(self, actor, tag):
+        'Determines the reason, if any, that "actor" cannot see "tag".'
         if actor == '@cosmos':
         # @cosmos can see everything at all times.
             return None
@@ -346,27 +588,7 @@ class World(WorldOrConcept):
         # None. If its Room is None and neither is the case, however, it 
         # must be "out of play."
             return 'item_in_play'
-        compartment = self.compartment_of(actor)
-        view_tags = []
-        if not compartment == actor_place:
-        # The Actor is is some sort of opaque compartment within a room.
-        # Only Items within that compartment will be visible.
-            view_tags = [str(compartment)]
-            for (link, child) in compartment.children:
-                if not link == 'on':
-                    view_tags += [child] 
-                    view_tags += self.descendants(child, stop='opaque')
-        else:
-        # Otherwise, list all the Items to which there is a line of sight
-        # in the Actor's Room and in every Room that has a view from there.
-            if self.item[str(actor_place)].door:
-                rooms_visible = self.item[str(actor_place)].connects
-            else:
-                rooms_visible = actor_place.view.keys()
-            for room_tag in [str(actor_place)] + rooms_visible:
-                view_tags += ([room_tag] + 
-                               self.descendants(room_tag, stop='opaque'))
-        if tag not in view_tags:
+        if tag not in self.in_view(actor):
             return 'line_of_sight'
         view = 1.0
         # Set the view to be perfect (1.0). This applies if the Actor and
@@ -402,16 +624,23 @@ class World(WorldOrConcept):
         # Assign blame to whichever value is smallest.
         return sight_culprit(self.item[tag].prominence, view, lit)
 
+    @tracing.traced('World.can_see')
     def can_see(self, actor, tag):
         'Is the item identified by "tag" visible to "actor"?'
         return self.prevents_sight(actor, tag) is None
 
     def reset(self):
         'Revert the World and Concepts to their initial states.'
-        self.undo(1)
+        self.undo_to(0)
         for actor in self.concept:
             self.concept[actor].roll_back_to(1)
 
+    def set_random(self, chance):
+        "Have the World and the Actors' Concepts draw on the random generator."
+        self.random = chance
+        for concept in self.concept.values():
+            concept.random = chance
+
     def set_concepts(self, actors):
         "Set initial information in all Actors' Concepts."
         for actor in self.item:
@@ -432,18 +661,21 @@ class World(WorldOrConcept):
         for actor in self.concept.keys():
             self.concept[actor].concept_of = actor
 
+    @tracing.traced('World.transfer')
     def transfer(self, item, actor, time):
         "Place an appropriate version of an Item in the Actor's Concept."
         concept = self.concept[actor]
         # If a Room, first add this Room as a child of @cosmos
         if item.room and str(item) not in self.concept[actor].item:
             new_cosmos = copy.deepcopy(concept.item['@cosmos'])
+            tracing.count('deepcopy')
             new_cosmos.add_child('in', str(item))
             concept.update_item(new_cosmos, time)
         # Now, the basic transfer applicable to all Items
         if (str(item) not in concept.item or
             not concept.item[str(item)] == item):
             seen_item = copy.deepcopy(item)
+            tracing.count('deepcopy')
             concept.update_item(seen_item, time)
             for (_, child) in item.children:
                 if self.can_see(actor, child):
@@ -460,20 +692,25 @@ class World(WorldOrConcept):
         concept = self.concept[actor]
         if str(item) in concept.item:
             missing_item = copy.deepcopy(concept.item[str(item)])
+            tracing.count('deepcopy')
             missing_item.link = 'of'
             missing_item.parent = '@cosmos'
             concept.update_item(missing_item, time)
 
+    def add_action(self, action):
+        'Record an Action that has been done.'
+        self.act[action.id] = action
+        self.done.append(action)
+
     def undo(self, action_id):
         'Revert the World back to the start time of the specified Action.'
-        new_ids = []
-        for i in self.act:
-            new_ids.append((i, self.act[i].start))
-        ids_times = sorted(new_ids, key=operator.itemgetter(1))
-        target_time = self.act[action_id].start
-        while len(ids_times) > 0 and ids_times[-1][1] >= target_time:
-            (last_id, _) = ids_times.pop()
-            last_action = self.act.pop(last_id)
+        self.undo_to(self.act[action_id].start)
+
+    def undo_to(self, target_time):
+        'Undo the Actions that started at or after the time, latest first.'
+        while len(self.done) > 0 and self.done[-1].start >= target_time:
+            last_action = self.done.pop()
+            del self.act[last_action.id]
             last_action.undo(self)
         self.back_up_clock(target_time)
 